@@ -0,0 +1,175 @@
+#   Copyright 2024 Valerio Orlandini
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+# Adaptive inference: the landmarker runs on a downscaled frame, or on a
+# crop around the landmarks of the previous frame, and the landmarks are
+# mapped back to the [0, 1] coordinates of the full frame. The landmarker
+# can also run only on one frame every few ones. With a target
+# frame rate, frames coming faster than the target are skipped and the
+# scale is lowered when the inference is too slow, raised when it is fast.
+# Crops are only used in the image running mode: in the video and live
+# stream modes, the landmarker tracks the landmarks of the previous frame in
+# image coordinates, which a crop moving between frames would break.
+
+import copy
+import time
+import cv2
+import numpy as np
+import detection as det
+import landmarks as lmk
+
+
+LANDMARK_FIELDS = ("face_landmarks", "hand_landmarks", "pose_landmarks")
+MIN_SCALE = 0.25
+# Smoothing of the measured inference time
+SMOOTHING = 0.1
+
+
+def _landmark_sets(result):
+    # result is a detection result, or a dictionary of them for a
+    # detection.DetectorGroup
+    for value in (result.values() if isinstance(result, dict) else (result,)):
+        for field in LANDMARK_FIELDS:
+            yield from getattr(value, field, ())
+
+
+class AdaptiveDetector:
+    # Wraps a detection.Detector or detection.DetectorGroup. roi is the
+    # margin added around the previous landmarks, as a fraction of their
+    # bounding box (0 always runs on the full frame); a full frame pass is
+    # also made when tracking is lost and every refresh seconds, to find new
+    # faces, hands or people.
+    def __init__(self, detector, scale=1.0, roi=0.0, target_fps=0.0, every=1, refresh=1.0):
+        self.detector = detector
+        self.every = every
+        self.max_scale = scale
+        self.scale = scale
+        self.roi = roi
+        self.budget = 1.0 / target_fps if target_fps > 0 else 0.0
+        self.refresh = refresh
+        self._box = None
+        self._next_refresh = 0.0
+        self._next_frame = 0.0
+        self._inference = None
+
+    def detect(self, frame, deliver):
+        if self.every > 1 and frame.index % self.every:
+            return
+        if self.budget:
+            if frame.timestamp < self._next_frame:
+                return
+            # A little tolerance, so that a camera running exactly at the
+            # target frame rate is not halved by jitter
+            self._next_frame = frame.timestamp + 0.9 * self.budget
+
+        height, width = frame.rgb.shape[:2]
+        box = self._box
+        if box is None or frame.timestamp >= self._next_refresh:
+            box = (0.0, 0.0, 1.0, 1.0)
+            self._next_refresh = frame.timestamp + self.refresh
+        x0, y0 = int(box[0] * width), int(box[1] * height)
+        x1, y1 = max(int(np.ceil(box[2] * width)), x0 + 1), max(int(np.ceil(box[3] * height)), y0 + 1)
+
+        # The scale bounds the number of pixels given to the landmarker: a
+        # crop is only downscaled if it is larger than the scaled frame
+        factor = min(self.scale * np.sqrt(width * height / ((x1 - x0) * (y1 - y0))), 1.0)
+        part = frame
+        if (x0, y0, x1, y1) != (0, 0, width, height) or factor < 1.0:
+            part = copy.copy(frame)
+            crop = frame.rgb[y0:y1, x0:x1]
+            if factor < 1.0:
+                size = (max(int((x1 - x0) * factor), 1), max(int((y1 - y0) * factor), 1))
+                part.rgb = cv2.resize(crop, size, interpolation=cv2.INTER_AREA)
+            else:
+                part.rgb = np.ascontiguousarray(crop)
+
+        start = time.perf_counter()
+        self.detector.detect(part, lambda part: self._deliver(
+            frame, part, deliver, start,
+            (x0 / width, y0 / height, (x1 - x0) / width, (y1 - y0) / height)))
+
+    def _deliver(self, frame, part, deliver, start, crop):
+        if self.budget:
+            self._adjust(time.perf_counter() - start)
+
+        cropped = crop != (0.0, 0.0, 1.0, 1.0)
+        left, top, crop_width, crop_height = crop
+        offset = np.array([left, top, 0.0], dtype=np.float32)
+        factor = np.array([crop_width, crop_height, crop_width], dtype=np.float32)
+        bounds = None
+        for landmarks in _landmark_sets(part.result):
+            if not cropped and self.roi <= 0:
+                break
+            points = lmk.to_array(landmarks)
+            if cropped:
+                points = points * factor + offset
+                for landmark, (x, y, z) in zip(landmarks, points.tolist()):
+                    landmark.x, landmark.y, landmark.z = x, y, z
+            if self.roi > 0 and len(points):
+                low, high = points[:, :2].min(axis=0), points[:, :2].max(axis=0)
+                if bounds is not None:
+                    low, high = np.minimum(low, bounds[:2]), np.maximum(high, bounds[2:])
+                bounds = (*low.tolist(), *high.tolist())
+
+        if bounds is not None:
+            margin_x = (bounds[2] - bounds[0]) * self.roi
+            margin_y = (bounds[3] - bounds[1]) * self.roi
+            self._box = (max(bounds[0] - margin_x, 0.0), max(bounds[1] - margin_y, 0.0),
+                         min(bounds[2] + margin_x, 1.0), min(bounds[3] + margin_y, 1.0))
+            if self._box[0] >= self._box[2] or self._box[1] >= self._box[3]:
+                self._box = None
+        else:
+            # Tracking lost: the next frame is searched whole
+            self._box = None
+
+        frame.result = part.result
+        deliver(frame)
+
+    def _adjust(self, elapsed):
+        if self._inference is None:
+            self._inference = elapsed
+        self._inference += SMOOTHING * (elapsed - self._inference)
+        if self._inference > self.budget:
+            self.scale = max(self.scale * 0.95, MIN_SCALE)
+        elif self._inference < 0.7 * self.budget:
+            self.scale = min(self.scale * 1.05, self.max_scale)
+
+    def close(self):
+        self.detector.close()
+
+
+def wrap(detector, scale=1.0, roi=0.0, target_fps=0.0, every=1, running=det.IMAGE):
+    # Returns the detector itself when no adaptive option is used; roi is
+    # ignored outside of the image running mode
+    if running != det.IMAGE:
+        roi = 0.0
+    if scale >= 1.0 and roi <= 0 and target_fps <= 0 and every <= 1:
+        return detector
+    return AdaptiveDetector(detector, min(scale, 1.0), roi, target_fps, every)
+
+
+def check_arguments(parser, args):
+    if args.roi > 0 and args.running != det.IMAGE:
+        parser.error("--roi can only be used with -r 0 (image running mode)")
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        '--every', help="run the landmarker only on one frame every this many (default 1, every frame)", type=int, default=1, metavar='N')
+    parser.add_argument(
+        '--scale', help="run the landmarker on frames downscaled by this factor (default 1.0, full size; with --target-fps, the largest scale used)", type=float, default=1.0)
+    parser.add_argument(
+        '--roi', help="run the landmarker on a crop around the previous landmarks, enlarged by this fraction of their size on each side (default 0, full frame; only with -r 0)", type=float, default=0.0, metavar='MARGIN')
+    parser.add_argument(
+        '--target-fps', help="skip frames above this frame rate and lower the scale when the inference cannot keep up (default 0, process every frame at the given scale)", type=float, default=0.0, metavar='FPS')
@@ -0,0 +1,186 @@
+#   Copyright 2024 Valerio Orlandini
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import argparse
+from concurrent import futures
+import json
+import os
+import time
+import cv2
+import landmarks as lmk
+import messages as msg
+import pipeline as pipe
+
+
+TRACKERS = ("face", "hands", "pose")
+IMAGE_EXTENSIONS = (".bmp", ".jpeg", ".jpg", ".png", ".tif", ".tiff", ".webp")
+
+
+class Collector:
+    # Stands in for osc_output.OscOutput, so that the trackers' send
+    # functions can be reused, and keeps the values of a frame by address
+    def __init__(self):
+        self.values = {}
+
+    def begin_frame(self, timestamp=None):
+        self.values = {}
+
+    def end_frame(self):
+        pass
+
+    def send(self, address, *values):
+        self.values[address] = values[0] if len(values) == 1 else list(values)
+
+    def send_value(self, address, value):
+        self.send(address, value)
+
+    def send_state(self, address, value):
+        self.send(address, value)
+
+    def send_landmarks(self, prefix, names, coords, visible=None):
+        for i, (name, row) in enumerate(zip(names, coords.tolist())):
+            if visible is None or visible[i]:
+                self.values[f"{prefix}/{name}/"] = row
+
+
+_worker = None
+
+
+def _init_worker(trackers, mode, out):
+    # One landmarker per tracker and per worker process, created once
+    global _worker
+    import face_track
+    import hands_track
+    import pose_track
+
+    detectors = {}
+    senders = []
+    if "face" in trackers:
+        detectors["face"] = face_track.face_detector()
+        layout = lmk.face_layout(mode)
+        senders.append(lambda output, results: msg.send_face(output, layout, msg.face_arrays(results["face"])))
+    if "hands" in trackers:
+        detectors["hands"] = hands_track.hand_detector()
+        hand_layout = lmk.hand_layout(mode)
+        senders.append(lambda output, results: msg.send_hands(output, hand_layout, msg.hand_arrays(results["hands"])))
+    if "pose" in trackers:
+        detectors["pose"] = pose_track.pose_detector()
+        pose_layout = lmk.pose_layout(mode)
+        senders.append(lambda output, results: msg.send_pose(output, pose_layout, msg.pose_arrays(results["pose"]), out))
+    _worker = (detectors, senders)
+
+
+def _frames(source, start, end, fps):
+    if isinstance(source, list):
+        for index in range(start, end):
+            yield index, None, cv2.imread(source[index])
+        return
+
+    capture = cv2.VideoCapture(source)
+    capture.set(cv2.CAP_PROP_POS_FRAMES, start)
+    for index in range(start, end):
+        success, img = capture.read()
+        if not success:
+            break
+        yield index, index / fps if fps > 0 else None, img
+    capture.release()
+
+
+def _process_chunk(chunk):
+    detectors, senders = _worker
+    collector = Collector()
+    rows = []
+    for index, timestamp, img in _frames(*chunk):
+        results = {}
+        if img is not None:
+            frame = pipe.Frame(index, timestamp or 0.0, img,
+                               cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+            for name, detector in detectors.items():
+                detector.detect(frame, lambda frame: None)
+                results[name] = frame.result
+        collector.begin_frame()
+        if results:
+            for send in senders:
+                send(collector, results)
+        rows.append({"frame": index, "time": timestamp, **collector.values})
+    return rows
+
+
+def _sources(inputs):
+    # Yields (name, source, frame count, frame rate): a source is a video
+    # path or the sorted list of the images of a directory
+    for path in inputs:
+        if os.path.isdir(path):
+            images = sorted(os.path.join(path, name) for name in os.listdir(path)
+                            if name.lower().endswith(IMAGE_EXTENSIONS))
+            yield path, images, len(images), 0.0
+        else:
+            capture = cv2.VideoCapture(path)
+            count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+            fps = capture.get(cv2.CAP_PROP_FPS)
+            capture.release()
+            if count <= 0:
+                print(f"Unable to read video file: {path}")
+                continue
+            yield path, path, count, fps
+
+
+def batch_track(inputs, trackers=TRACKERS, output_dir=".", mode=0, out=lmk.INSIDE, workers=None, chunk=100):
+    os.makedirs(output_dir, exist_ok=True)
+    total = 0
+    start_time = time.perf_counter()
+
+    with futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(tuple(trackers), mode, out)) as executor:
+        for name, source, count, fps in _sources(inputs):
+            chunks = [(source, start, min(start + chunk, count), fps)
+                      for start in range(0, count, chunk)]
+            stem = os.path.splitext(os.path.basename(os.path.normpath(name)))[0]
+            path = os.path.join(output_dir, f"{stem}.landmarks.jsonl")
+            # map() returns the chunks in order, whichever worker ends first
+            written = 0
+            with open(path, "w") as file:
+                for rows in executor.map(_process_chunk, chunks):
+                    for row in rows:
+                        file.write(json.dumps(row) + "\n")
+                    written += len(rows)
+            total += written
+            # The frame count of a video is only an estimate of the container
+            print(f"{name}: {written} frames written to {path}")
+
+    elapsed = time.perf_counter() - start_time
+    print(f"Processed {total} frames in {elapsed:.1f} s ({total / elapsed:.1f} frames per second)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Offline landmark extraction from video files and image directories")
+    parser.add_argument(
+        'inputs', help="video files or directories of images to process", nargs='+')
+    parser.add_argument(
+        '-t', '--trackers', help="trackers to run on each frame (default face hands pose)", nargs='+', choices=TRACKERS, default=list(TRACKERS))
+    parser.add_argument(
+        '-f', '--folder', help="folder where the results are written (default current folder)", default=".")
+    parser.add_argument(
+        '-m', '--mode', help="write a simplified and named list of the landmarks (0, default) or all the numbered landmarks (1)", type=int, default=0)
+    parser.add_argument(
+        '-o', '--out', help="pose tracking: do not write coordinates of the off-screen points (0), clamp their x/y inside [0.0, 1.0] (1) or write them as they are (2, default)", type=int, default=2)
+    parser.add_argument(
+        '-w', '--workers', help="number of worker processes (default: number of cores)", type=int, default=None)
+    parser.add_argument(
+        '-n', '--chunk', help="number of consecutive frames given to a worker at once (default 100)", type=int, default=100)
+    args = parser.parse_args()
+
+    batch_track(args.inputs, dict.fromkeys(args.trackers), args.folder,
+                args.mode, args.out, args.workers, args.chunk)
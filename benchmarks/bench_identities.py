@@ -0,0 +1,95 @@
+#   Copyright 2024 Valerio Orlandini
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+# Measures the cost per frame of matching people to persistent IDs, alone
+# and followed by sending their pose landmarks, as the number of people
+# grows. People walk randomly and are detected in a random order on every
+# frame; ID switches are counted against the true identities.
+
+import argparse
+import os
+import socket
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import identity as idt  # noqa: E402
+import landmarks as lmk  # noqa: E402
+import messages as msg  # noqa: E402
+import osc_output as osc  # noqa: E402
+
+
+def walk(people, frames, rng, step=0.01):
+    # Centroids of people spread across the frame, moving a little each frame
+    start = np.column_stack((np.linspace(0.1, 0.9, people), rng.uniform(0.3, 0.7, people)))
+    moves = rng.normal(0.0, step, (frames, people, 2))
+    return np.clip(start + np.cumsum(moves, axis=0), 0.0, 1.0)
+
+
+def bench(max_people=8, frames=500, port=9999):
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(("127.0.0.1", port))
+    rng = np.random.default_rng(0)
+    layout = lmk.pose_layout(0)
+    offsets = rng.uniform(-0.1, 0.1, (lmk.POSE_COUNT, 3)).astype(np.float32)
+
+    print(f"{'people':>8}{'assign us':>12}{'send us':>12}{'switches':>10}")
+    for people in range(1, max_people + 1):
+        centroids = walk(people, frames, rng)
+        orders = [rng.permutation(people) for _ in range(frames)]
+        poses = [[(i, offsets + np.array([*centroids[f, person], 0.0], dtype=np.float32))
+                  for i, person in enumerate(order)]
+                 for f, order in enumerate(orders)]
+
+        identities = idt.Identities(people)
+        start = time.perf_counter()
+        identified = [msg.identify(sets, identities) for sets in poses]
+        assign = (time.perf_counter() - start) / frames
+
+        # The first IDs given define the identity of each person
+        truth = {}
+        switches = 0
+        for order, sets in zip(orders, identified):
+            for person, (id, _) in zip(order, sets):
+                if truth.setdefault(person, id) != id:
+                    switches += 1
+                    truth[person] = id
+
+        output = osc.OscOutput("127.0.0.1", port, osc.ARRAY, True)
+        identities = idt.Identities(people)
+        start = time.perf_counter()
+        for sets in poses:
+            output.begin_frame()
+            msg.send_pose(output, layout, msg.identify(sets, identities), lmk.PASS, people)
+            output.end_frame()
+        send = (time.perf_counter() - start) / frames
+
+        print(f"{people:>8}{assign * 1e6:>12.1f}{send * 1e6:>12.1f}{switches:>10}")
+
+    sink.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Persistent ID association benchmark")
+    parser.add_argument(
+        '-n', '--people', help="maximum number of people (default 8)", type=int, default=8)
+    parser.add_argument(
+        '-f', '--frames', help="number of frames for each number of people (default 500)", type=int, default=500)
+    parser.add_argument(
+        '-p', '--port', help="local port of the UDP sink (default 9999)", type=int, default=9999)
+    args = parser.parse_args()
+
+    bench(args.people, args.frames, args.port)
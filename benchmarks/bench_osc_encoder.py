@@ -0,0 +1,91 @@
+#   Copyright 2024 Valerio Orlandini
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+# Compares the cost of sending one frame of landmarks through the
+# pythonosc SimpleUDPClient path used before the dedicated encoder against
+# OscOutput, for every schema, with and without bundles.
+
+import argparse
+import os
+import socket
+import sys
+import time
+import numpy as np
+from pythonosc import udp_client
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import osc_output as osc  # noqa: E402
+
+
+def simple_client_frame(client, prefix, names, coords):
+    for name, (x, y, z) in zip(names, coords.tolist()):
+        client.send_message(f"{prefix}/{name}/x/", x)
+        client.send_message(f"{prefix}/{name}/y/", y)
+        client.send_message(f"{prefix}/{name}/z/", z)
+
+
+def encoder_frame(output, prefix, names, coords):
+    output.begin_frame()
+    output.send_landmarks(prefix, names, coords)
+    output.end_frame()
+
+
+def measure(function, frames, *args):
+    function(*args)
+    start = time.perf_counter()
+    for coords in frames:
+        function(*args[:-1], coords)
+    return (time.perf_counter() - start) / len(frames)
+
+
+def bench(frames_count=200, port=9999):
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(("127.0.0.1", port))
+
+    sets = {
+        "face named (12)": ("/face", [str(i) for i in range(12)]),
+        "pose numbered (33)": ("/pose", [str(i) for i in range(33)]),
+        "face numbered (478)": ("/face", [str(i) for i in range(478)]),
+    }
+
+    rng = np.random.default_rng(0)
+    for label, (prefix, names) in sets.items():
+        frames = rng.random((frames_count, len(names), 3), dtype=np.float32)
+        print(f"{label}:")
+        client = udp_client.SimpleUDPClient("127.0.0.1", port)
+        baseline = measure(simple_client_frame, frames,
+                           client, prefix, names, frames[0])
+        print(f"  {'SimpleUDPClient':<22}{baseline * 1e6:10.1f} us/frame")
+        for compact in (osc.SPLIT, osc.POINT, osc.ARRAY):
+            for bundle in (False, True):
+                output = osc.OscOutput("127.0.0.1", port, compact, bundle)
+                elapsed = measure(encoder_frame, frames,
+                                  output, prefix, names, frames[0])
+                name = f"-c {compact}" + (" -b" if bundle else "")
+                print(f"  {name:<22}{elapsed * 1e6:10.1f} us/frame"
+                      f"{baseline / elapsed:8.1f}x")
+
+    sink.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="OSC encoder micro-benchmark")
+    parser.add_argument(
+        '-f', '--frames', help="number of frames to send for each case (default 200)", type=int, default=200)
+    parser.add_argument(
+        '-p', '--port', help="local port of the UDP sink (default 9999)", type=int, default=9999)
+    args = parser.parse_args()
+
+    bench(args.frames, args.port)
@@ -0,0 +1,108 @@
+#   Copyright 2024 Valerio Orlandini
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+# Measures the aggregate detection rate of face landmarker worker processes
+# reading synthetic frames from a shared-memory FrameRing, as workers are
+# added.
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import frame_ring as ring  # noqa: E402
+
+
+def worker(capture, counter, ready, running):
+    import face_track
+    import pipeline as pipe
+
+    detector = face_track.face_detector(running)
+    ready.release()
+    index = 0
+    while True:
+        success, rgb = capture.read()
+        if not success:
+            if capture.ended:
+                break
+            continue
+        frame = pipe.Frame(index, time.time(), None, rgb)
+        detector.detect(frame, lambda frame: None)
+        with counter.get_lock():
+            counter.value += 1
+        index += 1
+    detector.close()
+    capture.release()
+
+
+def bench(max_workers, duration=5.0, width=640, height=480, running=0):
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    context = multiprocessing.get_context("spawn")
+    rng = np.random.default_rng(0)
+    images = rng.integers(0, 256, (8, height, width, 3), dtype=np.uint8)
+
+    print(f"{'workers':>8}{'fps':>10}{'speedup':>10}")
+    single = None
+    for workers in range(1, max_workers + 1):
+        slots = 4 + 2 * workers
+        frames = ring.FrameRing(images[0].shape, slots)
+        claim = context.Value('q', -1)
+        counter = context.Value('q', 0)
+        ready = context.Semaphore(0)
+        processes = [context.Process(
+            target=worker,
+            args=(ring.RingCapture(frames.name, images[0].shape, slots, claim),
+                  counter, ready, running))
+            for _ in range(workers)]
+        for process in processes:
+            process.start()
+        for _ in processes:
+            ready.acquire()
+
+        # Frames are written at a steady 240 fps, faster than any worker
+        start = time.perf_counter()
+        counted = counter.value
+        i = 0
+        while time.perf_counter() - start < duration:
+            frames.write(images[i % len(images)])
+            i += 1
+            time.sleep(1.0 / 240)
+        fps = (counter.value - counted) / (time.perf_counter() - start)
+
+        frames.finish()
+        for process in processes:
+            process.join()
+        frames.close()
+
+        single = single or fps
+        print(f"{workers:>8}{fps:>10.1f}{fps / single:>10.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Shared-memory frame ring worker scaling benchmark")
+    parser.add_argument(
+        '-w', '--workers', help="maximum number of worker processes (default: number of cores)", type=int, default=os.cpu_count())
+    parser.add_argument(
+        '-t', '--time', help="seconds to measure for each number of workers (default 5)", type=float, default=5.0)
+    parser.add_argument(
+        '-s', '--size', help="width and height of the synthetic frames", nargs=2, type=int, default=[640, 480], metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument(
+        '-r', '--running', help="MediaPipe running mode of the workers (0 image, 1 video)", type=int, choices=(0, 1), default=0)
+    args = parser.parse_args()
+
+    bench(args.workers, args.time, args.size[0], args.size[1], args.running)
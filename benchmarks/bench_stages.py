@@ -0,0 +1,345 @@
+#   Copyright 2024 Valerio Orlandini
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+# Measures the latency of every stage of the trackers (capture, colour
+# conversion, inference, post-processing, OSC encoding and sending, drawing)
+# by running the tracker pipeline on synthetic frames or on a video clip,
+# with the OSC output received by a local UDP sink. Synthetic frames contain
+# no subject, so synthetic landmarks are injected in their detection results
+# before post-processing. Results are printed and written to a JSON file, to
+# compare versions.
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import detection as det  # noqa: E402
+import draw_landmarks as draw  # noqa: E402
+import landmarks as lmk  # noqa: E402
+import messages as msg  # noqa: E402
+import osc_output as osc  # noqa: E402
+import pipeline as pipe  # noqa: E402
+
+
+TRACKERS = ("face", "hands", "pose")
+STAGES = ("capture", "convert", "inference", "postprocess", "osc", "draw", "latency")
+PERCENTILES = (50, 95, 99)
+# Landmark count and range of the coordinates of the synthetic results; pose
+# landmarks also fall outside the frame, so that every -o option takes its
+# own path
+SYNTHETIC = {
+    "face": (478, 0.3, 0.7),
+    "hands": (21, 0.2, 0.8),
+    "pose": (33, -0.2, 1.2)
+}
+
+
+class BenchCapture:
+    # Stands in for cv2.VideoCapture, returning a fixed number of frames,
+    # synthetic or read from a clip, at most fps times per second. Once all
+    # frames are read, it waits for the last one to be sent before ending
+    # the stream, which stops the pipeline. waits holds the seconds slept before each
+    # frame, to take them out of the capture time
+    def __init__(self, images, count, fps=0.0, timeout=5.0):
+        self.images = images
+        self.count = count
+        self.interval = 1.0 / fps if fps > 0 else 0.0
+        self.timeout = timeout
+        self.index = 0
+        self.ended = False
+        self.waits = [0.0] * count
+        self.done = threading.Event()
+        self._next = 0.0
+
+    def read(self):
+        if self.index >= self.count:
+            self.done.wait(self.timeout)
+            self.ended = True
+            return False, None
+        if self.interval:
+            start = time.perf_counter()
+            delay = self._next - start
+            if delay > 0:
+                time.sleep(delay)
+                self.waits[self.index] = time.perf_counter() - start
+            self._next = max(self._next, time.perf_counter()) + self.interval
+        img = self.images[self.index % len(self.images)]
+        self.index += 1
+        return True, img
+
+    def release(self):
+        pass
+
+
+class UdpSink:
+    def __init__(self, port):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+        self.sock.bind(("127.0.0.1", port))
+        self.sock.settimeout(0.1)
+        self.datagrams = 0
+        self.bytes = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._receive, daemon=True)
+        self._thread.start()
+
+    def _receive(self):
+        while not self._stop.is_set():
+            try:
+                data = self.sock.recv(65536)
+            except socket.timeout:
+                continue
+            self.datagrams += 1
+            self.bytes += len(data)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self.sock.close()
+
+
+def load_images(clip, width, height, count=16):
+    if clip is None:
+        rng = np.random.default_rng(0)
+        return list(rng.integers(0, 256, (count, height, width, 3), dtype=np.uint8))
+    capture = cv2.VideoCapture(clip)
+    images = []
+    while True:
+        success, img = capture.read()
+        if not success:
+            break
+        images.append(img)
+    capture.release()
+    if not images:
+        raise SystemExit(f"Unable to read video file: {clip}")
+    return images
+
+
+def synthetic_results(tracker, count=16):
+    # Detection results with one face, two hands or one pose at random
+    # positions, in place of the empty results of the synthetic frames
+    python, vision, _, _ = det.tasks()
+    containers = python.components.containers
+    size, low, high = SYNTHETIC[tracker]
+    rng = np.random.default_rng(1)
+
+    def landmarks(world=False):
+        points = rng.uniform(low, high, (size, 3))
+        points[:, 2] = rng.uniform(-0.1, 0.1, size)
+        landmark = containers.Landmark if world else containers.NormalizedLandmark
+        return [landmark(x, y, z, 1.0, 1.0) for x, y, z in points.tolist()]
+
+    results = []
+    for _ in range(count):
+        if tracker == "face":
+            results.append(vision.FaceLandmarkerResult([landmarks()], [], []))
+        elif tracker == "hands":
+            handedness = [[containers.Category(0, 1.0, side, side)] for side in ("Left", "Right")]
+            results.append(vision.HandLandmarkerResult(
+                handedness, [landmarks(), landmarks()], [landmarks(True), landmarks(True)]))
+        else:
+            results.append(vision.PoseLandmarkerResult([landmarks()], [landmarks(True)]))
+    return results
+
+
+def tracker_parts(tracker, mode, out):
+    # Returns the detector factory, the post-processing function turning a
+    # detection result into landmark sets, the send function and the drawing
+    # function of a tracker
+    import face_track
+    import hands_track
+    import pose_track
+
+    if tracker == "face":
+        layout = lmk.face_layout(mode)
+        return (face_track.face_detector, msg.face_arrays,
+                lambda output, sets: msg.send_face(output, layout, sets),
+                draw.draw_face_landmarks_on_image)
+    if tracker == "hands":
+        layout = lmk.hand_layout(mode)
+        return (hands_track.hand_detector, msg.hand_arrays,
+                lambda output, sets: msg.send_hands(output, layout, sets),
+                draw.draw_hands_landmarks_on_image)
+    layout = lmk.pose_layout(mode)
+    return (pose_track.pose_detector, msg.pose_arrays,
+            lambda output, sets: msg.send_pose(output, layout, sets, out),
+            draw.draw_pose_landmarks_on_image)
+
+
+def summary(values):
+    if not values:
+        return None
+    values = np.array(values) * 1000.0
+    result = {f"p{p}": round(float(v), 3)
+              for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+    result["mean"] = round(float(values.mean()), 3)
+    return result
+
+
+def run_case(tracker, mode, out, images, frames, fps, running, compact, bundle, port, synthetic=False):
+    factory, arrays, send_sets, draw_result = tracker_parts(tracker, mode, out)
+    results = synthetic_results(tracker) if synthetic else None
+    detector = factory(running)
+    # The first detections are slower, as in the trackers before warm-up
+    detector.warm_up(images[0].shape[1], images[0].shape[0])
+    sink = UdpSink(port)
+    output = osc.OscOutput("127.0.0.1", port, compact, bundle)
+    samples = {stage: [] for stage in STAGES}
+    detections = 0
+    preview = None
+
+    def send(frame):
+        nonlocal detections, preview
+        detections += bool(arrays(frame.result))
+        if results is not None:
+            frame.result = results[frame.index % len(results)]
+        start = time.perf_counter()
+        sets = arrays(frame.result)
+        encode = time.perf_counter()
+        output.begin_frame(frame.timestamp)
+        send_sets(output, sets)
+        output.end_frame()
+        sent = time.perf_counter()
+        latency = time.time() - frame.timestamp
+        # Drawing happens on the preview thread in the trackers: it is timed
+        # here on a flipped copy, as the preview does, but not counted in the
+        # latency
+        if preview is None or preview.shape != frame.bgr.shape:
+            preview = np.empty_like(frame.bgr)
+        cv2.flip(frame.bgr, 1, dst=preview)
+        draw_result(preview, frame.result, True)
+        drawn = time.perf_counter()
+
+        # Capture time without the wait for the frame rate
+        frame.stages["capture"] -= capture.waits[frame.index]
+        for stage, value in frame.stages.items():
+            samples[stage].append(value)
+        samples["postprocess"].append(encode - start)
+        samples["osc"].append(sent - encode)
+        samples["draw"].append(drawn - sent)
+        samples["latency"].append(latency)
+        if frame.index == frames - 1:
+            capture.done.set()
+
+    capture = BenchCapture(images, frames, fps)
+    pipeline = pipe.Pipeline(capture, detector, send, profile=True)
+    start = time.perf_counter()
+    pipeline.run()
+    elapsed = time.perf_counter() - start
+    detector.close()
+    time.sleep(0.2)
+    sink.close()
+
+    processed = len(samples["latency"])
+    return {
+        "tracker": tracker,
+        "mode": mode,
+        "out": out if tracker == "pose" else None,
+        "frames": frames,
+        "processed": processed,
+        "detected": detections,
+        "synthetic": synthetic,
+        "dropped": pipeline.frames.dropped + pipeline.results.dropped,
+        "fps": round(processed / elapsed, 2),
+        "capture_fps": fps,
+        "datagrams": sink.datagrams,
+        "bytes": sink.bytes,
+        "stages_ms": {stage: summary(samples[stage]) for stage in STAGES}
+    }
+
+
+def version():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench(trackers=TRACKERS, frames=200, width=640, height=480, clip=None, fps=30.0, running=det.IMAGE, compact=osc.SPLIT, bundle=False, port=9999, output="bench_stages.json"):
+    output = os.path.abspath(output)
+    images = load_images(clip and os.path.abspath(clip), width, height)
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    cases = []
+    for tracker in trackers:
+        for mode in (0, 1):
+            for out in (lmk.INSIDE, lmk.CLAMP, lmk.PASS) if tracker == "pose" else (None,):
+                label = f"{tracker} -m {mode}" + (f" -o {out}" if out is not None else "")
+                try:
+                    case = run_case(tracker, mode, out, images, frames, fps,
+                                    running, compact, bundle, port, clip is None)
+                except (OSError, RuntimeError, ValueError) as error:
+                    print(f"{label}: skipped ({error})")
+                    continue
+                cases.append(case)
+                print(f"{label}: {case['fps']:.1f} fps, "
+                      f"{case['detected']}/{case['processed']} frames with detections"
+                      + (" (synthetic landmarks sent)" if case["synthetic"] else "")
+                      + f", {case['dropped']} dropped")
+                for stage, values in case["stages_ms"].items():
+                    if values is not None:
+                        print(f"  {stage:<12}" + "".join(
+                            f"{name} {value:8.3f} ms  " for name, value in values.items()))
+
+    report = {
+        "version": version(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "source": clip or "synthetic",
+        "size": list(images[0].shape[1::-1]),
+        "running": running,
+        "compact": compact,
+        "bundle": bundle,
+        "cases": cases
+    }
+    with open(output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Per-stage latency benchmark of the trackers")
+    parser.add_argument(
+        '-t', '--trackers', help="trackers to measure (default face hands pose)", nargs='+', choices=TRACKERS, default=list(TRACKERS))
+    parser.add_argument(
+        '-n', '--frames', help="number of frames captured for each case (default 200)", type=int, default=200)
+    parser.add_argument(
+        '-s', '--size', help="width and height of the synthetic frames", nargs=2, type=int, default=[640, 480], metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument(
+        '-i', '--clip', help="video clip to use instead of synthetic frames (looped if shorter than the number of frames)", default=None)
+    parser.add_argument(
+        '-f', '--fps', help="frame rate of the capture (default 30, 0 as fast as possible)", type=float, default=30.0)
+    parser.add_argument(
+        '-r', '--running', help="MediaPipe running mode (0 image, 1 video, 2 live stream)", type=int, choices=(0, 1, 2), default=0)
+    parser.add_argument(
+        '-c', '--compact', help="OSC schema (0 split, 1 point, 2 array)", type=int, choices=(0, 1, 2), default=0)
+    parser.add_argument(
+        '-b', '--bundle', help="send each frame as an OSC bundle", action='store_true')
+    parser.add_argument(
+        '-p', '--port', help="local port of the UDP sink (default 9999)", type=int, default=9999)
+    parser.add_argument(
+        '-o', '--output', help="JSON file where the results are written (default bench_stages.json)", default="bench_stages.json")
+    args = parser.parse_args()
+
+    bench(args.trackers, args.frames, args.size[0], args.size[1], args.clip,
+          args.fps, args.running, args.compact, args.bundle, args.port, args.output)
@@ -0,0 +1,126 @@
+#   Copyright 2024 Valerio Orlandini
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+# Face blendshapes and facial transformation matrix. The 52 blendshape
+# scores of a face are sent in one message, /face/blendshapes/, in the
+# order of NAMES. With a threshold or a change filter, the message carries
+# index and score pairs of the selected scores only. The matrix is sent as
+# /face/matrix/ with its 16 values, row by row. With persistent IDs, the
+# addresses are /face/<id>/blendshapes/ and /face/<id>/matrix/.
+
+import time
+import numpy as np
+
+
+NAMES = (
+    "_neutral", "browDownLeft", "browDownRight", "browInnerUp",
+    "browOuterUpLeft", "browOuterUpRight", "cheekPuff", "cheekSquintLeft",
+    "cheekSquintRight", "eyeBlinkLeft", "eyeBlinkRight", "eyeLookDownLeft",
+    "eyeLookDownRight", "eyeLookInLeft", "eyeLookInRight", "eyeLookOutLeft",
+    "eyeLookOutRight", "eyeLookUpLeft", "eyeLookUpRight", "eyeSquintLeft",
+    "eyeSquintRight", "eyeWideLeft", "eyeWideRight", "jawForward", "jawLeft",
+    "jawOpen", "jawRight", "mouthClose", "mouthDimpleLeft", "mouthDimpleRight",
+    "mouthFrownLeft", "mouthFrownRight", "mouthFunnel", "mouthLeft",
+    "mouthLowerDownLeft", "mouthLowerDownRight", "mouthPressLeft",
+    "mouthPressRight", "mouthPucker", "mouthRight", "mouthRollLower",
+    "mouthRollUpper", "mouthShrugLower", "mouthShrugUpper", "mouthSmileLeft",
+    "mouthSmileRight", "mouthStretchLeft", "mouthStretchRight",
+    "mouthUpperUpLeft", "mouthUpperUpRight", "noseSneerLeft", "noseSneerRight")
+
+# Keys of the blendshapes and matrices in the sets given to the prediction
+# module, next to the landmarks of each tracker
+BLENDSHAPES = "blendshapes"
+MATRIX = "matrix"
+
+
+def blendshape_arrays(detection_result):
+    return [(i, np.fromiter((category.score for category in categories),
+                            dtype=np.float32, count=len(categories)))
+            for i, categories in enumerate(detection_result.face_blendshapes or ())]
+
+
+def matrix_arrays(detection_result):
+    return [(i, np.asarray(matrix, dtype=np.float32))
+            for i, matrix in enumerate(detection_result.facial_transformation_matrixes or ())]
+
+
+class FaceScores:
+    # threshold only sends the scores above it, and once more the scores
+    # that fall below it; changed only sends the scores that moved by more
+    # than it since they were last sent, or that crossed the threshold, and
+    # all of them every keyframe seconds
+    def __init__(self, threshold=0.0, changed=0.0, keyframe=1.0):
+        self.threshold = threshold
+        self.changed = changed
+        self.keyframe = keyframe
+        self._sent = {}
+        self._next_keyframe = 0.0
+
+    def send(self, output, shapes, matrices=(), count=1):
+        keyframe = False
+        if self.changed:
+            now = time.monotonic()
+            keyframe = self.keyframe > 0 and now >= self._next_keyframe
+            if keyframe:
+                self._next_keyframe = now + self.keyframe
+
+        for slot, scores in shapes:
+            if count == 1 and slot > 0:
+                break
+            prefix = f"/face/{slot}" if count > 1 else "/face"
+            scores = np.clip(scores, 0.0, 1.0)
+            if not self.threshold and not self.changed:
+                output.send(f"{prefix}/blendshapes/", *scores.tolist())
+                continue
+            # Last values sent for the face, as the receiver knows them
+            last = self._sent.get(slot)
+            force = keyframe
+            if last is None:
+                last = self._sent[slot] = np.zeros_like(scores)
+                force = True
+            above = scores > self.threshold
+            was_above = last > self.threshold
+            selected = above.copy()
+            if self.changed and not force:
+                selected &= (np.abs(scores - last) > self.changed) | ~was_above
+            # Scores falling below the threshold are sent once more, so that
+            # the receiver does not keep their last high value
+            selected |= was_above & ~above
+            np.copyto(last, scores, where=selected)
+            indices = np.flatnonzero(selected)
+            if self.changed and not len(indices):
+                continue
+            # Without the change filter, a message is sent on every frame,
+            # empty when no score is above the threshold
+            pairs = np.empty(2 * len(indices), dtype=object)
+            pairs[0::2] = indices.tolist()
+            pairs[1::2] = scores[indices].tolist()
+            output.send(f"{prefix}/blendshapes/", *pairs)
+
+        for slot, matrix in matrices:
+            if count == 1 and slot > 0:
+                break
+            prefix = f"/face/{slot}" if count > 1 else "/face"
+            output.send(f"{prefix}/matrix/", *matrix.ravel().tolist())
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        '--blendshapes', help="compute the 52 face blendshape scores and send them in one /face/blendshapes/ message per frame", action='store_true')
+    parser.add_argument(
+        '--blendshapes-threshold', help="only send the blendshape scores above this value, as index and score pairs (default 0, send all the scores)", type=float, default=0.0, metavar='THRESHOLD')
+    parser.add_argument(
+        '--blendshapes-changed', help="only send the blendshape scores that changed by more than this amount, as index and score pairs, and all of them every second (default 0, send all the scores)", type=float, default=0.0, metavar='DELTA')
+    parser.add_argument(
+        '--matrix', help="compute the facial transformation matrix and send it as a /face/matrix/ message of 16 values", action='store_true')
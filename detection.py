@@ -0,0 +1,243 @@
+#   Copyright 2024 Valerio Orlandini
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import copy
+from concurrent import futures
+import os
+import queue
+import threading
+import time
+import types
+import numpy as np
+
+
+# Values of the -r / --running option
+IMAGE = 0
+VIDEO = 1
+LIVE_STREAM = 2
+
+# Models are looked up next to the scripts, whatever the working directory
+MODELS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+
+# Seconds to wait for the warm-up result in LIVE_STREAM mode
+WARM_UP_TIMEOUT = 5.0
+
+_tasks = None
+_models = {}
+
+
+def tasks():
+    # Imports the MediaPipe Tasks API on first use, so that scripts and
+    # modules that do not detect anything never load MediaPipe, and returns
+    # its python and vision modules and its Image and ImageFormat classes
+    global _tasks
+    if _tasks is None:
+        import mediapipe as mp
+        from mediapipe.tasks import python
+        from mediapipe.tasks.python import vision
+        _tasks = (python, vision, mp.Image, mp.ImageFormat)
+    return _tasks
+
+
+def vision():
+    return tasks()[1]
+
+
+def model_buffer(model):
+    # Contents of a model file of MODELS, read once and shared by all the
+    # detectors that use it (MediaPipe copies model_asset_buffer anyway)
+    buffer = _models.get(model)
+    if buffer is None:
+        with open(os.path.join(MODELS, model), "rb") as file:
+            buffer = _models[model] = file.read()
+    return buffer
+
+
+class Detector:
+    # Wraps a MediaPipe landmarker so that every running mode is used in the
+    # same way: detect(frame, deliver) stores the detection result in
+    # frame.result and calls deliver(frame), either immediately or, in live
+    # stream mode, from the MediaPipe callback thread
+    def __init__(self, landmarker, options, model, running=IMAGE, **kwargs):
+        self.running = running
+        self._last_ms = -1
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._deliver = None
+
+        python, vision, self._image, image_format = tasks()
+        self._srgb = image_format.SRGB
+        running_modes = {
+            IMAGE: vision.RunningMode.IMAGE,
+            VIDEO: vision.RunningMode.VIDEO,
+            LIVE_STREAM: vision.RunningMode.LIVE_STREAM
+        }
+        if running == LIVE_STREAM:
+            kwargs["result_callback"] = self._on_result
+        base_options = python.BaseOptions(model_asset_buffer=model_buffer(model))
+        self.landmarker = landmarker.create_from_options(
+            options(base_options=base_options,
+                    running_mode=running_modes[running], **kwargs))
+
+    def _timestamp_ms(self, frame):
+        # MediaPipe needs strictly increasing timestamps in VIDEO and
+        # LIVE_STREAM modes, even if the wall clock goes back
+        self._last_ms = max(int(frame.timestamp * 1000), self._last_ms + 1)
+        return self._last_ms
+
+    def detect(self, frame, deliver):
+        image = self._image(image_format=self._srgb, data=frame.rgb)
+        if self.running == IMAGE:
+            frame.result = self.landmarker.detect(image)
+        elif self.running == VIDEO:
+            frame.result = self.landmarker.detect_for_video(
+                image, self._timestamp_ms(frame))
+        else:
+            timestamp_ms = self._timestamp_ms(frame)
+            with self._lock:
+                self._deliver = deliver
+                self._pending[timestamp_ms] = frame
+            self.landmarker.detect_async(image, timestamp_ms)
+            return
+        deliver(frame)
+
+    def _on_result(self, result, output_image, timestamp_ms):
+        with self._lock:
+            frame = self._pending.pop(timestamp_ms, None)
+            # Frames older than this one were dropped by the landmarker
+            for stale in [ms for ms in self._pending if ms < timestamp_ms]:
+                del self._pending[stale]
+            deliver = self._deliver
+        if frame is not None:
+            frame.result = result
+            deliver(frame)
+
+    def warm_up(self, width=640, height=480):
+        # Runs the landmarker once on a black frame, as the first detections
+        # are much slower than the next ones
+        frame = types.SimpleNamespace(rgb=np.zeros((height, width, 3), dtype=np.uint8),
+                                      timestamp=time.time(), result=None)
+        done = threading.Event()
+        self.detect(frame, lambda frame: done.set())
+        done.wait(WARM_UP_TIMEOUT)
+
+    def close(self):
+        self.landmarker.close()
+
+
+class DetectorGroup:
+    # Runs several detectors on the same frame, each one on its own thread,
+    # and delivers the frame once all of them are done, with frame.result
+    # holding a dictionary of the detection results by name
+    def __init__(self, detectors):
+        self.detectors = detectors
+        self._executor = futures.ThreadPoolExecutor(max_workers=len(detectors))
+        self._partial = {}
+        self._lock = threading.Lock()
+
+    def detect(self, frame, deliver):
+        with self._lock:
+            self._partial[frame.index] = {}
+        jobs = []
+        for name, detector in self.detectors.items():
+            part = copy.copy(frame)
+            jobs.append(self._executor.submit(
+                detector.detect, part,
+                lambda part, name=name: self._collect(frame, name, part.result, deliver)))
+        # In IMAGE and VIDEO modes this waits for the inference to complete,
+        # in LIVE_STREAM mode only for the frame to be handed to MediaPipe
+        for job in futures.as_completed(jobs):
+            job.result()
+
+    def _collect(self, frame, name, result, deliver):
+        with self._lock:
+            results = self._partial.get(frame.index)
+            if results is None:
+                return
+            results[name] = result
+            if len(results) < len(self.detectors):
+                return
+            # Frames that are still incomplete were dropped by a landmarker
+            for stale in [index for index in self._partial if index <= frame.index]:
+                del self._partial[stale]
+        frame.result = results
+        deliver(frame)
+
+    def warm_up(self, width=640, height=480):
+        for detector in self.detectors.values():
+            detector.warm_up(width, height)
+
+    def close(self):
+        self._executor.shutdown()
+        for detector in self.detectors.values():
+            detector.close()
+
+
+class DetectorPool:
+    # Shares a few detectors between the frames of several cameras:
+    # detect(frame, deliver) runs on the first free detector, waiting for
+    # one when they are all busy. MediaPipe releases the GIL during the
+    # inference, so the detectors run in parallel on several cores
+    def __init__(self, detectors):
+        self.detectors = detectors
+        self._free = queue.SimpleQueue()
+        for detector in detectors:
+            self._free.put(detector)
+
+    def detect(self, frame, deliver):
+        detector = self._free.get()
+        try:
+            detector.detect(frame, deliver)
+        finally:
+            self._free.put(detector)
+
+    def warm_up(self, width=640, height=480):
+        for detector in self.detectors:
+            detector.warm_up(width, height)
+
+    def close(self):
+        for detector in self.detectors:
+            detector.close()
+
+
+def camera_detectors(factory, cameras, running=IMAGE):
+    # Returns the detector of each camera, made with factory(). In IMAGE
+    # mode the cameras share a pool of one detector per core at most; when
+    # tracking across frames each camera needs its own, as a landmarker
+    # follows a single stream of frames
+    if running != IMAGE or cameras == 1:
+        return [factory() for _ in range(cameras)]
+    pool = DetectorPool([factory() for _ in range(min(cameras, os.cpu_count() or 1))])
+    return [pool] * cameras
+
+
+def _unique(detectors):
+    return {id(detector): detector for detector in detectors}.values()
+
+
+def warm_up(detectors, width=640, height=480):
+    # Warms up each detector of a list once, shared ones included
+    for detector in _unique(detectors):
+        detector.warm_up(width, height)
+
+
+def close_all(detectors):
+    # Closes each detector of a list once, shared ones included
+    for detector in _unique(detectors):
+        detector.close()
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        '-r', '--running', help="detect landmarks on each frame independently (0, default), track them across frames (1) or track them asynchronously without blocking the capture (2)", type=int, choices=(IMAGE, VIDEO, LIVE_STREAM), default=IMAGE)
@@ -1,84 +1,82 @@
-#   Copyright 2023 The MediaPipe Authors / 2024 Valerio Orlandini
-#
-#   Licensed under the Apache License, Version 2.0 (the "License");
-#   you may not use this file except in compliance with the License.
-#   You may obtain a copy of the License at
-#
-#       http://www.apache.org/licenses/LICENSE-2.0
-#
-#   Unless required by applicable law or agreed to in writing, software
-#   distributed under the License is distributed on an "AS IS" BASIS,
-#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
-#   See the License for the specific language governing permissions and
-#   limitations under the License.
-
-import cv2
-from mediapipe import solutions
-from mediapipe.framework.formats import landmark_pb2
-import numpy as np
-
-
-def draw_face_landmarks_on_image(rgb_image, detection_result):
-    face_landmarks_list = detection_result.face_landmarks
-    annotated_image = np.copy(rgb_image)
-
-    for idx in range(len(face_landmarks_list)):
-        face_landmarks = face_landmarks_list[idx]
-
-        face_landmarks_proto = landmark_pb2.NormalizedLandmarkList()
-        face_landmarks_proto.landmark.extend([
-            landmark_pb2.NormalizedLandmark(x=landmark.x, y=landmark.y, z=landmark.z) for landmark in face_landmarks
-        ])
-
-        solutions.drawing_utils.draw_landmarks(
-            image=annotated_image,
-            landmark_list=face_landmarks_proto,
-            connections=solutions.face_mesh.FACEMESH_TESSELATION,
-            landmark_drawing_spec=None,
-            connection_drawing_spec=solutions.drawing_styles
-            .get_default_face_mesh_tesselation_style())
-
-    return annotated_image
-
-
-def draw_pose_landmarks_on_image(rgb_image, detection_result):
-    pose_landmarks_list = detection_result.pose_landmarks
-    annotated_image = np.copy(rgb_image)
-
-    for idx in range(len(pose_landmarks_list)):
-        pose_landmarks = pose_landmarks_list[idx]
-
-        pose_landmarks_proto = landmark_pb2.NormalizedLandmarkList()
-        pose_landmarks_proto.landmark.extend([
-            landmark_pb2.NormalizedLandmark(x=landmark.x, y=landmark.y, z=landmark.z) for landmark in pose_landmarks
-        ])
-        solutions.drawing_utils.draw_landmarks(
-            annotated_image,
-            pose_landmarks_proto,
-            solutions.pose.POSE_CONNECTIONS,
-            solutions.drawing_styles.get_default_pose_landmarks_style())
-
-    return annotated_image
-
-
-def draw_hands_landmarks_on_image(rgb_image, detection_result):
-    hand_landmarks_list = detection_result.hand_landmarks
-    handedness_list = detection_result.handedness
-    annotated_image = np.copy(rgb_image)
-
-    for idx in range(len(hand_landmarks_list)):
-        hand_landmarks = hand_landmarks_list[idx]
-        handedness = handedness_list[idx]
-
-        hand_landmarks_proto = landmark_pb2.NormalizedLandmarkList()
-        hand_landmarks_proto.landmark.extend([
-            landmark_pb2.NormalizedLandmark(x=landmark.x, y=landmark.y, z=landmark.z) for landmark in hand_landmarks
-        ])
-        solutions.drawing_utils.draw_landmarks(
-            annotated_image,
-            hand_landmarks_proto,
-            solutions.hands.HAND_CONNECTIONS,
-            solutions.drawing_styles.get_default_hand_landmarks_style(),
-            solutions.drawing_styles.get_default_hand_connections_style())
-
-    return annotated_image
+#   Copyright 2023 The MediaPipe Authors / 2024 Valerio Orlandini
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+# Preview renderer. Landmarks are drawn in place on a BGR image, straight
+# from their (N, 3) array, with all the connections of a landmark set drawn
+# by a single cv2.polylines call. With mirror=True the landmarks are drawn
+# on an image that has already been flipped horizontally.
+
+import cv2
+import numpy as np
+import detection as det
+import landmarks as lmk
+
+
+_segments = {}
+
+
+def landmark_segments(name):
+    # Connections of the face, hand or pose landmarks, as an (N, 2) array of
+    # landmark indices, taken from MediaPipe the first time they are drawn
+    if name not in _segments:
+        vision = det.vision()
+        connections = {
+            "face": vision.FaceLandmarksConnections.FACE_LANDMARKS_TESSELATION,
+            "hands": vision.HandLandmarksConnections.HAND_CONNECTIONS,
+            "pose": vision.PoseLandmarksConnections.POSE_LANDMARKS
+        }[name]
+        _segments[name] = np.array([(c.start, c.end) for c in connections], dtype=np.intp)
+    return _segments[name]
+
+
+LINE_COLOR = (224, 224, 224)
+POINT_COLOR = (48, 48, 255)
+
+
+def draw_landmarks(image, points, segments, mirror=False, point_radius=0):
+    height, width = image.shape[:2]
+    pixels = np.empty((len(points), 2), dtype=np.int32)
+    x = points[:, 0]
+    if mirror:
+        x = 1.0 - x
+    pixels[:, 0] = x * width
+    pixels[:, 1] = points[:, 1] * height
+
+    cv2.polylines(image, pixels[segments], False, LINE_COLOR, 1)
+    if point_radius:
+        for center in pixels.tolist():
+            cv2.circle(image, center, point_radius, POINT_COLOR, -1)
+
+    return image
+
+
+def draw_face_landmarks_on_image(image, detection_result, mirror=False):
+    for face_landmarks in detection_result.face_landmarks:
+        draw_landmarks(image, lmk.to_array(face_landmarks), landmark_segments("face"), mirror)
+
+    return image
+
+
+def draw_pose_landmarks_on_image(image, detection_result, mirror=False):
+    for pose_landmarks in detection_result.pose_landmarks:
+        draw_landmarks(image, lmk.to_array(pose_landmarks), landmark_segments("pose"), mirror, 3)
+
+    return image
+
+
+def draw_hands_landmarks_on_image(image, detection_result, mirror=False):
+    for hand_landmarks in detection_result.hand_landmarks:
+        draw_landmarks(image, lmk.to_array(hand_landmarks), landmark_segments("hands"), mirror, 3)
+
+    return image
@@ -12,112 +12,89 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
+import adaptive as adapt
 import argparse
-import cv2
+import blendshapes as bs
+import detection as det
 import draw_landmarks as draw
-import mediapipe as mp
-from mediapipe.tasks import python
-from mediapipe.tasks.python import vision
-import numpy as np
-from pythonosc import udp_client
-
-
-def face_track(width=640, height=480, address="127.0.0.1", port=8000, device=0, mode=0):
-    base_options = python.BaseOptions(
-        model_asset_path='models/face_landmarker.task')
-    options = vision.FaceLandmarkerOptions(base_options=base_options,
-                                           output_face_blendshapes=True,
-                                           num_faces=1)
-    detector = vision.FaceLandmarker.create_from_options(options)
-
-    capture = cv2.VideoCapture(device)
-
-    client = udp_client.SimpleUDPClient(address, port)
-
-    face_marks = {
-        "chin": 199,
-        "upperlip": 11,
-        "lowerlip": 16,
-        "nose": 4,
-        "rightcheek": 205,
-        "leftcheek": 425,
-        "righteyebrow": 52,
-        "lefteyebrow": 282,
-        "righteye": 468,
-        "lefteye": 473,
-        "forehead": 151
-    }
-    
-    fail_counter = 0
-
-    capture.set(3, width)
-    capture.set(4, height)
-
-    while cv2.waitKey(1) == -1:
-        try:
-            success, img = capture.read()
-            if not success:
-                fail_counter += 1
-                if (fail_counter < 50):
-                    continue
-                else:
-                    print("Unable to capture from camera: too many failed attempts")
-                    break
-        except:
-            fail_counter += 1
-            if (fail_counter < 50):
-                continue
-            else:
-                print("Unable to capture from camera: too many failed attempts")
-                break
-        fail_counter = 0
-
-        imgRGB = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        
-        image = mp.Image(image_format=mp.ImageFormat.SRGB, data=imgRGB)
-        detection_result = detector.detect(image)
-
-        
-        if len(detection_result.face_landmarks) > 0:
-            if mode:
-                for idx, lm in enumerate(detection_result.face_landmarks[0]):
-                    client.send_message(
-                        f"/face/{idx}/x/", 1.0 - lm.x)
-                    client.send_message(
-                        f"/face/{idx}/y/", 1.0 - lm.y)
-                    client.send_message(
-                        f"/face/{idx}/z/", lm.z)
-            else:
-                for key, idx in face_marks.items():
-                    lm = detection_result.face_landmarks[0][idx]
-                    client.send_message(   
-                        f"/face/{key}/x/", 1.0 - lm.x)
-                    client.send_message(
-                        f"/face/{key}/y/", 1.0 - lm.y)
-                    client.send_message(
-                        f"/face/{key}/z/", lm.z)
-                mouth_around = []
-                for i in (82, 312, 87, 317):
-                    lm = detection_result.face_landmarks[0][i]
-                    mouth_around.append((lm.x, lm.y, lm.z))
-                ma_array = np.array(mouth_around)
-                mouth_coords = ma_array.mean(axis=0)
-                client.send_message(
-                    f"/face/mouth/x/", 1.0 - mouth_coords[0])
-                client.send_message(
-                    f"/face/mouth/y/", 1.0 - mouth_coords[1])
-                client.send_message(
-                    f"/face/mouth/z/", mouth_coords[2])
-
-        client.send_message("/face/tracked/",
-                            len(detection_result.face_landmarks))
-        
-        annotated_image = draw.draw_face_landmarks_on_image(
-            image.numpy_view(), detection_result)
-        cv2.imshow("Face Tracking", cv2.cvtColor(
-            cv2.flip(annotated_image, 1), cv2.COLOR_RGB2BGR))
-
-    capture.release()
+import identity as idt
+import landmarks as lmk
+import messages as msg
+import osc_output as osc
+import pipeline as pipe
+import prediction as pred
+import recording as rec
+import stats as st
+
+
+def face_detector(running=det.IMAGE, count=1, blendshapes=False, matrix=False):
+    vision = det.vision()
+    return det.Detector(vision.FaceLandmarker, vision.FaceLandmarkerOptions,
+                        'face_landmarker.task', running,
+                        output_face_blendshapes=blendshapes,
+                        output_facial_transformation_matrixes=matrix,
+                        num_faces=count)
+
+
+def face_track(width=640, height=480, address="127.0.0.1", port=8000, device=0, mode=0, compact=osc.SPLIT, bundle=False, deadband=0.0, keyframe=1.0, running=det.IMAGE, headless=False, preview_fps=0.0, record=None, stats=0.0, stats_port=None, scale=1.0, roi=0.0, target_fps=0.0, every=1, predict=0.0, targets=None, count=1, blendshapes=False, blendshapes_threshold=0.0, blendshapes_changed=0.0, matrix=False, backend="any", fourcc=None, capture_fps=0.0, buffer_size=0, startup_report=False, capture=None):
+    report = st.StartupReport() if startup_report else None
+
+    # device is one index, or a list of them to track several cameras
+    devices = device if isinstance(device, (list, tuple)) else [device]
+    captures = [capture] if capture is not None else pipe.open_captures(devices, width, height, backend, fourcc, capture_fps, buffer_size)
+    cameras = len(captures)
+    if report is not None:
+        report.mark("cameras")
+    detectors = det.camera_detectors(lambda: face_detector(running, count, blendshapes, matrix), cameras, running)
+    if report is not None:
+        report.mark("models")
+    det.warm_up(detectors, width, height)
+    if report is not None:
+        report.mark("warm-up")
+
+    layout = lmk.face_layout(mode)
+
+    def camera(n, capture, detector):
+        # Everything but the detectors is separate for each camera
+        prefix = pipe.camera_prefix(n, cameras)
+        output = osc.OscOutput(address, port, compact, bundle, deadband, keyframe, targets, prefix)
+
+        recorder = rec.Recorder(rec.camera_path(record, n, cameras), rec.stride(["face"])) if record else None
+
+        identities = idt.Identities(count) if count > 1 else None
+        scores = bs.FaceScores(blendshapes_threshold, blendshapes_changed, keyframe) if blendshapes or matrix else None
+
+        def messages(index, sets, measured):
+            if measured is not None:
+                output.send_value("/face/measured/", measured)
+            msg.send_face(output, layout, sets[rec.FACE], count)
+            if scores is not None:
+                scores.send(output, sets[bs.BLENDSHAPES], sets[bs.MATRIX], count)
+
+        sender = pipe.CameraOutput(output, messages, recorder, predict, report)
+
+        def send(frame):
+            sets = {rec.FACE: msg.face_arrays(frame.result)}
+            if scores is not None:
+                sets[bs.BLENDSHAPES] = bs.blendshape_arrays(frame.result)
+                sets[bs.MATRIX] = bs.matrix_arrays(frame.result)
+            if identities is not None:
+                ids = msg.assign_ids(sets[rec.FACE], identities)
+                sets = {key: msg.relabel(values, ids) for key, values in sets.items()}
+            sender.send(frame, sets)
+
+        tracker_stats = st.Stats(prefix + "/face", output, stats, stats_port) if stats > 0 else None
+
+        pipeline = pipe.Pipeline(capture, adapt.wrap(detector, scale, roi, target_fps, every, running), send,
+                                 None if headless else draw.draw_face_landmarks_on_image,
+                                 pipe.camera_title("Face Tracking", n, cameras), preview_fps,
+                                 stats=tracker_stats)
+        return pipeline, sender
+
+    try:
+        pipe.run_cameras(captures, detectors, camera)
+    finally:
+        det.close_all(detectors)
 
 
 if __name__ == '__main__':
@@ -126,14 +103,35 @@ if __name__ == '__main__':
     parser.add_argument(
         '-a', '--address', help="address to send OSC messages (default 127.0.0.1)", default="127.0.0.1")
     parser.add_argument(
-        '-d', '--device', help="index of the video device to use (default 0)", type=int, default=0)
+        '-d', '--device', help="index of the video device to use (default 0); with several, each camera is tracked and sent under /cam/<n>/", type=int, nargs='+', default=0)
     parser.add_argument(
         '-m', '--mode', help="send a simplified and named list of the landmarks (0, default) or send all the numbered landmarks (1)", type=int, default=0)
+    parser.add_argument(
+        '-n', '--count', help="maximum number of faces to track (default 1); with more, each face is sent under /face/<id>/", type=int, default=1)
     parser.add_argument(
         '-p', '--port', help="port to send OSC messages (default 8000)", type=int, default=8000)
     parser.add_argument(
         '-s', '--size', help="width and height of the capture window", nargs=2, type=int, default=[640, 480], metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument(
+        '--record', help="also write the landmarks to a recording file, to be sent again with replay.py", metavar='FILE', default=None)
+    osc.add_arguments(parser)
+    st.add_arguments(parser)
+    det.add_arguments(parser)
+    adapt.add_arguments(parser)
+    pred.add_arguments(parser)
+    bs.add_arguments(parser)
+    pipe.add_arguments(parser)
     args = parser.parse_args()
+    adapt.check_arguments(parser, args)
 
     face_track(args.size[0], args.size[1],
-               args.address, args.port, args.device, args.mode)
+               args.address, args.port, args.device, args.mode,
+               args.compact, args.bundle, args.deadband, args.keyframe,
+               args.running, args.headless, args.preview_fps, args.record,
+               args.stats, args.stats_port,
+               args.scale, args.roi, args.target_fps, args.every,
+               args.predict, args.target, args.count,
+               args.blendshapes, args.blendshapes_threshold,
+               args.blendshapes_changed, args.matrix,
+               args.backend, args.fourcc, args.capture_fps, args.buffer_size,
+               args.startup_report)
@@ -0,0 +1,228 @@
+#   Copyright 2024 Valerio Orlandini
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+# Features derived from the hand and pose landmarks, computed once for all
+# the detected sets of a frame, and sent as one message per group:
+#
+#   distances/        distances between pairs of landmarks (*_DISTANCES)
+#   angles/           angles at joints, in degrees (*_ANGLES)
+#   openness/         hands only, from 0 (fist) to 1 (open hand)
+#   velocity/         x y z of each row sent for the landmarks, per second
+#   acceleration/     x y z of each row sent for the landmarks, per second²
+#
+# under the prefix of the landmarks of each set (/hands/left, /pose or,
+# with persistent IDs, /hands/<id> and /pose/<id>). Distances and angles
+# are measured with x and z scaled by the aspect ratio of the frame; hand
+# distances are in palm lengths, pose distances in frame heights. Velocity
+# and acceleration are in the mirrored coordinates of the landmark
+# messages, from a quadratic fit of the last HISTORY frames.
+
+import numpy as np
+import messages as msg
+
+
+GROUPS = ("distances", "angles", "openness", "velocity", "acceleration")
+
+HAND_DISTANCES = {
+    "thumbindex": (4, 8),
+    "thumbmiddle": (4, 12),
+    "thumbring": (4, 16),
+    "thumbpinky": (4, 20)
+}
+
+# Angle at the middle landmark of each triple
+HAND_ANGLES = {
+    "thumb": (2, 3, 4),
+    "index": (5, 6, 7),
+    "middle": (9, 10, 11),
+    "ring": (13, 14, 15),
+    "pinky": (17, 18, 19)
+}
+
+POSE_DISTANCES = {
+    "wrists": (15, 16),
+    "ankles": (27, 28)
+}
+
+POSE_ANGLES = {
+    "leftelbow": (11, 13, 15),
+    "rightelbow": (12, 14, 16),
+    "leftknee": (23, 25, 27),
+    "rightknee": (24, 26, 28)
+}
+
+HAND_TIPS = (4, 8, 12, 16, 20)
+HAND_PALM = (0, 5, 9, 13, 17)
+# Wrist to the base of the middle finger
+HAND_LENGTH = (0, 9)
+# Mean distance of the fingertips from the palm centre, in palm lengths, of
+# a fist and of an open hand
+CLOSED = 0.8
+OPEN = 1.8
+
+HISTORY = 5
+# Sets not seen for this many seconds start a new history
+MAX_AGE = 0.25
+
+# Sign of the velocity in the mirrored coordinates of the messages
+MIRROR = np.array([-1.0, -1.0, 1.0], dtype=np.float32)
+
+# Key of the features in the sets given to the prediction module, next to
+# the landmarks of the tracker
+FEATURES = "features"
+
+
+def _norms(vectors):
+    return np.sqrt(np.einsum('...k,...k->...', vectors, vectors))
+
+
+class Features:
+    # prefix is /hands or /pose, names the groups to compute and layout the
+    # layout of the landmark messages, whose rows get velocity and
+    # acceleration. Each set gets one float32 array with all its features,
+    # group after group in the order of GROUPS.
+    def __init__(self, prefix, names=GROUPS, layout=None, history=HISTORY):
+        self.prefix = prefix
+        self.hands = prefix == "/hands"
+        self.layout = layout
+        self.history = history
+        distances = HAND_DISTANCES if self.hands else POSE_DISTANCES
+        angles = HAND_ANGLES if self.hands else POSE_ANGLES
+        self._distances = np.array(list(distances.values()), dtype=np.intp)
+        self._angles = np.array(list(angles.values()), dtype=np.intp)
+
+        rows = len(layout.names) if layout is not None else 0
+        sizes = {"distances": len(distances), "angles": len(angles),
+                 "openness": 1 if self.hands else 0,
+                 "velocity": 3 * rows, "acceleration": 3 * rows}
+        self.groups = []
+        start = 0
+        for name in GROUPS:
+            if name in names and sizes[name]:
+                self.groups.append((name, start, start + sizes[name]))
+                start += sizes[name]
+        self.size = start
+        self._motion = any(name in ("velocity", "acceleration") for name, _, _ in self.groups)
+        self._histories = {}
+
+    def compute(self, sets, timestamp, aspect=1.0):
+        # sets is a list of (slot, points) as sent by the messages module;
+        # returns a list of (slot, features)
+        unique = {}
+        for slot, points in sets:
+            unique.setdefault(slot, points)
+        if not unique:
+            self._histories = {}
+            return []
+
+        points = np.stack(list(unique.values()))
+        scaled = points * np.array([aspect, 1.0, aspect], dtype=np.float32)
+        values = np.empty((len(unique), self.size), dtype=np.float32)
+        lengths = None
+        if self.hands:
+            lengths = _norms(scaled[:, HAND_LENGTH[0]] - scaled[:, HAND_LENGTH[1]])
+            lengths = np.maximum(lengths, 1e-6)
+
+        for name, start, stop in self.groups:
+            if name == "distances":
+                pairs = self._distances
+                distances = _norms(scaled[:, pairs[:, 0]] - scaled[:, pairs[:, 1]])
+                if lengths is not None:
+                    distances /= lengths[:, None]
+                values[:, start:stop] = distances
+            elif name == "angles":
+                triples = self._angles
+                a = scaled[:, triples[:, 0]] - scaled[:, triples[:, 1]]
+                b = scaled[:, triples[:, 2]] - scaled[:, triples[:, 1]]
+                norms = _norms(a) * _norms(b)
+                cosines = np.einsum('...k,...k->...', a, b) / np.maximum(norms, 1e-12)
+                values[:, start:stop] = np.degrees(np.arccos(np.clip(cosines, -1.0, 1.0)))
+            elif name == "openness":
+                palm = scaled[:, HAND_PALM].mean(axis=1, keepdims=True)
+                spread = _norms(scaled[:, HAND_TIPS] - palm).mean(axis=1)
+                values[:, start] = np.clip((spread / lengths - CLOSED) / (OPEN - CLOSED), 0.0, 1.0)
+
+        if self._motion:
+            histories = {}
+            for row, (slot, slot_points) in enumerate(unique.items()):
+                histories[slot] = history = self._update(slot, slot_points, timestamp)
+                velocity, acceleration = self._fit(history, timestamp)
+                for name, start, stop in self.groups:
+                    if name == "velocity":
+                        values[row, start:stop] = velocity
+                    elif name == "acceleration":
+                        values[row, start:stop] = acceleration
+            # Sets that are no longer detected are forgotten
+            self._histories = histories
+
+        return list(zip(unique, values))
+
+    def _update(self, slot, points, timestamp):
+        # Ring buffer of the times and rows of the last frames of a set
+        history = self._histories.get(slot)
+        if history is not None:
+            times, rows, count = history
+            if not 0.0 < timestamp - times[(count - 1) % self.history] <= MAX_AGE:
+                history = None
+        if history is None:
+            times = np.zeros(self.history)
+            rows = np.zeros((self.history, len(self.layout.names), 3), dtype=np.float32)
+            count = 0
+        times[count % self.history] = timestamp
+        rows[count % self.history] = self.layout.select(points)
+        return times, rows, count + 1
+
+    def _fit(self, history, timestamp):
+        times, rows, count = history
+        valid = min(count, self.history)
+        if valid < 2:
+            return 0.0, 0.0
+        t = times[:valid] - timestamp
+        y = rows[:valid].reshape(valid, -1)
+        if valid == 2:
+            order = np.argsort(t)
+            velocity = (y[order[1]] - y[order[0]]) / (t[order[1]] - t[order[0]])
+            return (velocity.reshape(-1, 3) * MIRROR).ravel(), 0.0
+        # Quadratic in time, relative to the last frame: its derivatives
+        # at 0 are the velocity and acceleration of the last frame
+        powers = np.column_stack((t * t, t, np.ones(valid)))
+        coefficients = np.linalg.solve(powers.T @ powers, powers.T @ y)
+        velocity = (coefficients[1].reshape(-1, 3) * MIRROR).ravel()
+        acceleration = (2.0 * coefficients[0].reshape(-1, 3) * MIRROR).ravel()
+        return velocity, acceleration
+
+    def send(self, output, features, count=1):
+        # count is the count of the landmark messages, more than 2 hands or
+        # 1 pose being sent with persistent IDs
+        identified = count > (2 if self.hands else 1)
+        for slot, values in features:
+            if identified:
+                prefix = f"{self.prefix}/{slot}"
+            elif self.hands:
+                prefix = f"{self.prefix}/{msg.HAND_SIDES[slot]}"
+            elif slot > 0:
+                break
+            else:
+                prefix = self.prefix
+            for name, start, stop in self.groups:
+                group = values[start:stop]
+                if name == "openness":
+                    # Predicted values may overshoot
+                    group = np.clip(group, 0.0, 1.0)
+                output.send(f"{prefix}/{name}/", *group.tolist())
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        '--features', help="also send these features derived from the landmarks: " + ", ".join(GROUPS) + " (default: none; openness is for hands only)", nargs='+', choices=GROUPS, default=[], metavar='FEATURE')
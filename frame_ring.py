@@ -0,0 +1,149 @@
+#   Copyright 2024 Valerio Orlandini
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+# Ring buffer of RGB frames in shared memory. One capture process writes the
+# frames, tagged with increasing sequence numbers, and any number of tracker
+# processes read them as NumPy arrays mapped on the shared memory, without
+# pickling or copying.
+
+import multiprocessing
+from multiprocessing import shared_memory
+import time
+import cv2
+import numpy as np
+
+
+CLOSED = 0
+LATEST = 1
+HEADER = 2
+
+
+class FrameRing:
+    def __init__(self, shape, slots=8, name=None):
+        self.shape = tuple(shape)
+        self.slots = slots
+        frame_size = int(np.prod(self.shape))
+        header_size = 8 * (HEADER + 2 * slots)
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(
+            name=name, create=self.owner,
+            size=header_size + slots * frame_size)
+        self.name = self.shm.name
+
+        self._header = np.ndarray((HEADER,), dtype=np.int64, buffer=self.shm.buf)
+        self._sequences = np.ndarray((slots,), dtype=np.int64, buffer=self.shm.buf,
+                                     offset=8 * HEADER)
+        self._timestamps = np.ndarray((slots,), dtype=np.float64, buffer=self.shm.buf,
+                                      offset=8 * (HEADER + slots))
+        self.frames = np.ndarray((slots,) + self.shape, dtype=np.uint8,
+                                 buffer=self.shm.buf, offset=header_size)
+        if self.owner:
+            self._header[:] = (0, -1)
+            self._sequences[:] = -1
+
+    @property
+    def closed(self):
+        return bool(self._header[CLOSED])
+
+    @property
+    def latest(self):
+        return int(self._header[LATEST])
+
+    def write(self, bgr, timestamp=None):
+        # Converts the captured BGR frame straight into the next slot
+        sequence = self.latest + 1
+        slot = sequence % self.slots
+        self._sequences[slot] = -1
+        cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB, dst=self.frames[slot])
+        self._timestamps[slot] = time.time() if timestamp is None else timestamp
+        self._sequences[slot] = sequence
+        self._header[LATEST] = sequence
+        return sequence
+
+    def frame(self, sequence):
+        # Returns the timestamp and the shared array of a frame, or None if
+        # the frame has already been overwritten
+        slot = sequence % self.slots
+        if self._sequences[slot] != sequence:
+            return None
+        return float(self._timestamps[slot]), self.frames[slot]
+
+    def finish(self):
+        # Tells the readers that no more frames will be written
+        self._header[CLOSED] = 1
+
+    def close(self):
+        self._header = self._sequences = self._timestamps = self.frames = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # Frames still referenced elsewhere keep the mapping alive until
+            # the process exits
+            pass
+        if self.owner:
+            self.shm.unlink()
+
+
+class RingCapture:
+    # Drop-in replacement of cv2.VideoCapture for the trackers, reading the
+    # newest frame of a FrameRing. Workers sharing the same claim counter
+    # split the frames among themselves, each frame going to one of them.
+    # Frames are already RGB, so the pipeline does not convert them. When
+    # read() fails, ended tells that the ring was closed and waiting that no
+    # new frame came within the timeout.
+    rgb = True
+
+    def __init__(self, name, shape, slots, claim=None, timeout=0.1):
+        self.name = name
+        self.shape = shape
+        self.slots = slots
+        self.claim = claim if claim is not None else multiprocessing.Value('q', -1)
+        self.timeout = timeout
+        self.ring = None
+        self.ended = False
+        self.waiting = False
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["ring"] = None
+        return state
+
+    def set(self, prop, value):
+        return False
+
+    def read(self):
+        if self.ring is None:
+            self.ring = FrameRing(self.shape, self.slots, self.name)
+
+        self.waiting = False
+        deadline = time.monotonic() + self.timeout
+        while not self.ring.closed:
+            latest = self.ring.latest
+            with self.claim.get_lock():
+                if latest > self.claim.value:
+                    self.claim.value = latest
+                    frame = self.ring.frame(latest)
+                    if frame is not None:
+                        return True, frame[1]
+            if time.monotonic() > deadline:
+                self.waiting = True
+                return False, None
+            time.sleep(0.0005)
+        self.ended = True
+        return False, None
+
+    def release(self):
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
@@ -12,119 +12,88 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
+import adaptive as adapt
 import argparse
-import cv2
+import detection as det
 import draw_landmarks as draw
-import mediapipe as mp
-from mediapipe.tasks import python
-from mediapipe.tasks.python import vision
-import numpy as np
-from pythonosc import udp_client
-
-
-def hand_track(width=640, height=480, address="127.0.0.1", port=8000, device=0, mode=0):
-    base_options = python.BaseOptions(
-        model_asset_path='models/hand_landmarker.task')
-    options = vision.HandLandmarkerOptions(base_options=base_options,
-                                           num_hands=2)
-    detector = vision.HandLandmarker.create_from_options(options)
-
-    capture = cv2.VideoCapture(device)
-
-    client = udp_client.SimpleUDPClient(address, port)
-
-    hand_marks = {
-        "wrist": 0,
-        "thumb": 4,
-        "index": 8,
-        "middle": 12,
-        "ring": 16,
-        "pinky": 20
-    }
-    
-    fail_counter = 0
-
-    capture.set(3, width)
-    capture.set(4, height)
-
-    while cv2.waitKey(1) == -1:
-        try:
-            success, img = capture.read()
-            if not success:
-                fail_counter += 1
-                if (fail_counter < 50):
-                    continue
-                else:
-                    print("Unable to capture from camera: too many failed attempts")
-                    break
-        except:
-            fail_counter += 1
-            if (fail_counter < 50):
-                continue
-            else:
-                print("Unable to capture from camera: too many failed attempts")
-                break
-        fail_counter = 0
-
-        imgRGB = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        
-        image = mp.Image(image_format=mp.ImageFormat.SRGB, data=imgRGB)
-        detection_result = detector.detect(image)
-
-        handsfound = {"left": False, "right": False}
-        
-        for i, hand_handedness in enumerate(detection_result.handedness):
-            hand_type = str.lower(hand_handedness[0].category_name)
-            landmarks = detection_result.hand_landmarks[i]
-            if not handsfound[hand_type]:
-                client.send_message(
-                    f"/hands/{hand_type}/tracked/", 1)
-                if mode:
-                    for idx, lm in enumerate(landmarks):
-                        client.send_message(
-                            f"/hands/{hand_type}/{idx}/x/", 1.0 - lm.x)
-                        client.send_message(
-                            f"/hands/{hand_type}/{idx}/y/", 1.0 - lm.y)
-                        client.send_message(
-                            f"/hands/{hand_type}/{idx}/z/", lm.z)
-                else:
-                    for key, idx in hand_marks.items():
-                        lm = landmarks[idx]
-                        client.send_message(
-                            f"/hands/{hand_type}/{key}/x/", 1.0 - lm.x)
-                        client.send_message(
-                            f"/hands/{hand_type}/{key}/y/", 1.0 - lm.y)
-                        client.send_message(
-                            f"/hands/{hand_type}/{key}/z/", lm.z)
-                    palm_around = []
-                    for i in (0, 5, 9, 13, 17):
-                        lm = landmarks[i]
-                        palm_around.append((lm.x, lm.y, lm.z))
-                    pa_array = np.array(palm_around)
-                    palm_coords = pa_array.mean(axis=0)
-                    client.send_message(
-                        f"/hands/{hand_type}/palm/x/", 1.0 - palm_coords[0])
-                    client.send_message(
-                        f"/hands/{hand_type}/palm/y/", 1.0 - palm_coords[1])
-                    client.send_message(
-                        f"/hands/{hand_type}/palm/z/", palm_coords[2])
-
-                handsfound[hand_type] = True
-
-        if not handsfound["left"]:
-            client.send_message("/hands/left/tracked/", 0)
-        if not handsfound["right"]:
-            client.send_message("/hands/right/tracked/", 0)
-
-        client.send_message("/hands/tracked/",
-                            len(detection_result.handedness))
-        
-        annotated_image = draw.draw_hands_landmarks_on_image(
-            image.numpy_view(), detection_result)
-        cv2.imshow("Hands Tracking", cv2.cvtColor(
-            cv2.flip(annotated_image, 1), cv2.COLOR_RGB2BGR))
-
-    capture.release()
+import features as feat
+import identity as idt
+import landmarks as lmk
+import messages as msg
+import osc_output as osc
+import pipeline as pipe
+import prediction as pred
+import recording as rec
+import stats as st
+
+
+def hand_detector(running=det.IMAGE, count=2):
+    vision = det.vision()
+    return det.Detector(vision.HandLandmarker, vision.HandLandmarkerOptions,
+                        'hand_landmarker.task', running,
+                        num_hands=count)
+
+
+def hand_track(width=640, height=480, address="127.0.0.1", port=8000, device=0, mode=0, compact=osc.SPLIT, bundle=False, deadband=0.0, keyframe=1.0, running=det.IMAGE, headless=False, preview_fps=0.0, record=None, stats=0.0, stats_port=None, scale=1.0, roi=0.0, target_fps=0.0, every=1, predict=0.0, targets=None, count=2, features=(), backend="any", fourcc=None, capture_fps=0.0, buffer_size=0, startup_report=False, capture=None):
+    report = st.StartupReport() if startup_report else None
+
+    # device is one index, or a list of them to track several cameras
+    devices = device if isinstance(device, (list, tuple)) else [device]
+    captures = [capture] if capture is not None else pipe.open_captures(devices, width, height, backend, fourcc, capture_fps, buffer_size)
+    cameras = len(captures)
+    if report is not None:
+        report.mark("cameras")
+    detectors = det.camera_detectors(lambda: hand_detector(running, count), cameras, running)
+    if report is not None:
+        report.mark("models")
+    det.warm_up(detectors, width, height)
+    if report is not None:
+        report.mark("warm-up")
+
+    layout = lmk.hand_layout(mode)
+
+    def camera(n, capture, detector):
+        # Everything but the detectors is separate for each camera
+        prefix = pipe.camera_prefix(n, cameras)
+        output = osc.OscOutput(address, port, compact, bundle, deadband, keyframe, targets, prefix)
+
+        recorder = rec.Recorder(rec.camera_path(record, n, cameras), rec.stride(["hands"])) if record else None
+
+        identities = idt.Identities(count, 2) if count > 2 else None
+
+        derived = feat.Features("/hands", features, layout) if features else None
+
+        def messages(index, sets, measured):
+            if measured is not None:
+                output.send_value("/hands/measured/", measured)
+            msg.send_hands(output, layout, sets[rec.HANDS], count)
+            if derived is not None:
+                derived.send(output, sets[feat.FEATURES], count)
+
+        sender = pipe.CameraOutput(output, messages, recorder, predict, report)
+
+        def send(frame):
+            hands = msg.hand_arrays(frame.result)
+            if identities is not None:
+                hands = msg.identify(hands, identities, True)
+            sets = {rec.HANDS: hands}
+            if derived is not None:
+                aspect = frame.rgb.shape[1] / frame.rgb.shape[0]
+                sets[feat.FEATURES] = derived.compute(hands, frame.timestamp, aspect)
+            sender.send(frame, sets)
+
+        tracker_stats = st.Stats(prefix + "/hands", output, stats, stats_port) if stats > 0 else None
+
+        pipeline = pipe.Pipeline(capture, adapt.wrap(detector, scale, roi, target_fps, every, running), send,
+                                 None if headless else draw.draw_hands_landmarks_on_image,
+                                 pipe.camera_title("Hands Tracking", n, cameras), preview_fps,
+                                 stats=tracker_stats)
+        return pipeline, sender
+
+    try:
+        pipe.run_cameras(captures, detectors, camera)
+    finally:
+        det.close_all(detectors)
 
 
 if __name__ == '__main__':
@@ -133,14 +102,33 @@ if __name__ == '__main__':
     parser.add_argument(
         '-a', '--address', help="address to send OSC messages (default 127.0.0.1)", default="127.0.0.1")
     parser.add_argument(
-        '-d', '--device', help="index of the video device to use (default 0)", type=int, default=0)
+        '-d', '--device', help="index of the video device to use (default 0); with several, each camera is tracked and sent under /cam/<n>/", type=int, nargs='+', default=0)
     parser.add_argument(
         '-m', '--mode', help="send a simplified and named list of the landmarks (0, default) or send all the numbered landmarks (1)", type=int, default=0)
+    parser.add_argument(
+        '-n', '--count', help="maximum number of hands to track (default 2, one left and one right); with more, each hand is sent under /hands/<id>/", type=int, default=2)
     parser.add_argument(
         '-p', '--port', help="port to send OSC messages (default 8000)", type=int, default=8000)
     parser.add_argument(
         '-s', '--size', help="width and height of the capture window", nargs=2, type=int, default=[640, 480], metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument(
+        '--record', help="also write the landmarks to a recording file, to be sent again with replay.py", metavar='FILE', default=None)
+    osc.add_arguments(parser)
+    st.add_arguments(parser)
+    det.add_arguments(parser)
+    adapt.add_arguments(parser)
+    pred.add_arguments(parser)
+    feat.add_arguments(parser)
+    pipe.add_arguments(parser)
     args = parser.parse_args()
+    adapt.check_arguments(parser, args)
 
     hand_track(args.size[0], args.size[1],
-               args.address, args.port, args.device, args.mode)
+               args.address, args.port, args.device, args.mode,
+               args.compact, args.bundle, args.deadband, args.keyframe,
+               args.running, args.headless, args.preview_fps, args.record,
+               args.stats, args.stats_port,
+               args.scale, args.roi, args.target_fps, args.every,
+               args.predict, args.target, args.count, args.features,
+               args.backend, args.fourcc, args.capture_fps, args.buffer_size,
+               args.startup_report)
@@ -0,0 +1,89 @@
+#   Copyright 2024 Valerio Orlandini
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+# Persistent IDs for faces, hands and people. Each detection is matched to
+# the closest known track, by the distance between centroids, from one
+# cost matrix for all of them. Detections can belong to groups (the hand
+# sides), and are only matched to tracks of the same group. IDs are the
+# smallest free ones, so that they stay within a small known range, and
+# are kept for a while after a track is lost, so that someone leaving the
+# frame for a moment gets the same ID back.
+
+import time
+import numpy as np
+
+
+MAX_DISTANCE = 0.25
+TIMEOUT = 0.5
+
+
+class Identities:
+    # count is the number of IDs of each group: the ID of the n-th track of
+    # group g is n * groups + g, so IDs are always below count * groups
+    def __init__(self, count, groups=1, max_distance=MAX_DISTANCE, timeout=TIMEOUT):
+        self.count = count
+        self.groups = groups
+        self.max_distance = max_distance
+        self.timeout = timeout
+        self._centroids = np.zeros((count * groups, 2))
+        self._seen = np.full(count * groups, -np.inf)
+
+    @property
+    def size(self):
+        return self.count * self.groups
+
+    def assign(self, centroids, groups=None, now=None):
+        # centroids is an (N, 2) array and groups, if given, the group of
+        # each centroid; returns the ID of each one
+        now = time.monotonic() if now is None else now
+        centroids = np.asarray(centroids, dtype=np.float64).reshape(-1, 2)
+        detections = len(centroids)
+        groups = np.zeros(detections, dtype=np.intp) if groups is None else np.asarray(groups, dtype=np.intp)
+        ids = np.full(detections, -1, dtype=np.intp)
+        if not detections:
+            return ids
+
+        alive = self._seen > now - self.timeout
+        cost = np.linalg.norm(self._centroids[:, None, :] - centroids[None, :, :], axis=2)
+        track_groups = np.arange(self.size) % self.groups
+        cost[(track_groups[:, None] != groups[None, :]) | ~alive[:, None]] = np.inf
+        cost[cost > self.max_distance] = np.inf
+
+        # Greedy assignment, cheapest pair first: for the few tracks of a
+        # show it matches the optimal one in nearly every frame
+        for _ in range(min(self.size, detections)):
+            track, detection = np.unravel_index(np.argmin(cost), cost.shape)
+            if not np.isfinite(cost[track, detection]):
+                break
+            ids[detection] = track
+            cost[track, :] = np.inf
+            cost[:, detection] = np.inf
+
+        taken = np.zeros(self.size, dtype=bool)
+        taken[ids[ids >= 0]] = True
+        for detection in np.flatnonzero(ids < 0):
+            candidates = np.flatnonzero((track_groups == groups[detection]) & ~taken)
+            if not len(candidates):
+                continue
+            # The smallest ID that is not alive, or else the one lost for
+            # the longest time
+            free = candidates[~alive[candidates]]
+            track = free[0] if len(free) else candidates[np.argmin(self._seen[candidates])]
+            ids[detection] = track
+            taken[track] = True
+
+        matched = ids >= 0
+        self._centroids[ids[matched]] = centroids[matched]
+        self._seen[ids[matched]] = now
+        return ids
@@ -0,0 +1,176 @@
+#   Copyright 2024 Valerio Orlandini
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+# Landmark post-processing shared by the trackers. Each detected landmark
+# list is converted once into an (N, 3) float32 array of x, y and z, and
+# everything else is done with precomputed indices on that array.
+
+import itertools
+import numpy as np
+
+
+FACE_COUNT = 478
+HAND_COUNT = 21
+POSE_COUNT = 33
+
+FACE_MARKS = {
+    "chin": 199,
+    "upperlip": 11,
+    "lowerlip": 16,
+    "nose": 4,
+    "rightcheek": 205,
+    "leftcheek": 425,
+    "righteyebrow": 52,
+    "lefteyebrow": 282,
+    "righteye": 468,
+    "lefteye": 473,
+    "forehead": 151
+}
+
+FACE_CENTROIDS = {
+    "mouth": (82, 312, 87, 317)
+}
+
+HAND_MARKS = {
+    "wrist": 0,
+    "thumb": 4,
+    "index": 8,
+    "middle": 12,
+    "ring": 16,
+    "pinky": 20
+}
+
+HAND_CENTROIDS = {
+    "palm": (0, 5, 9, 13, 17)
+}
+
+POSE_MARKS = {
+    "nose": 0,
+    "lefteye": 2,
+    "righteye": 5,
+    "leftear": 7,
+    "rightear": 8,
+    "leftshoulder": 11,
+    "rightshoulder": 12,
+    "leftelbow": 13,
+    "rightelbow": 14,
+    "leftwrist": 15,
+    "rightwrist": 16,
+    "leftpinky": 17,
+    "rightpinky": 18,
+    "leftindex": 19,
+    "rightindex": 20,
+    "leftthumb": 21,
+    "rightthumb": 22,
+    "lefthip": 23,
+    "righthip": 24,
+    "leftknee": 25,
+    "rightknee": 26,
+    "leftankle": 27,
+    "rightankle": 28,
+    "leftheel": 29,
+    "rightheel": 30,
+    "leftfootindex": 31,
+    "rightfootindex": 32
+}
+
+POSE_CENTROIDS = {
+    "mouth": (9, 10),
+    "torso": (11, 12, 23, 24)
+}
+
+# Values of the pose -o / --out option
+INSIDE = 0
+CLAMP = 1
+PASS = 2
+
+
+def to_array(landmarks):
+    count = len(landmarks)
+    values = itertools.chain.from_iterable(
+        (lm.x, lm.y, lm.z) for lm in landmarks)
+    return np.fromiter(values, dtype=np.float32, count=3 * count).reshape(count, 3)
+
+
+class LandmarkLayout:
+    # Named rows sent for a landmark set: either all the numbered landmarks
+    # or a subset of named landmarks followed by the centroids of groups of
+    # landmarks
+    def __init__(self, count, marks=None, centroids=None):
+        self.count = count
+        if marks is None:
+            self.names = [str(i) for i in range(count)]
+            self.indices = None
+            self.weights = None
+            return
+
+        centroids = centroids or {}
+        self.names = list(marks) + list(centroids)
+        self.indices = np.fromiter(marks.values(), dtype=np.intp, count=len(marks))
+        self.weights = np.zeros((len(centroids), count), dtype=np.float32)
+        for row, group in enumerate(centroids.values()):
+            self.weights[row, list(group)] = 1.0 / len(group)
+
+    def select(self, points):
+        if self.indices is None:
+            return np.array(points, dtype=np.float32)
+        if not len(self.weights):
+            return points[self.indices]
+        return np.concatenate((points[self.indices], self.weights @ points))
+
+
+FACE_NAMED = LandmarkLayout(FACE_COUNT, FACE_MARKS, FACE_CENTROIDS)
+HAND_NAMED = LandmarkLayout(HAND_COUNT, HAND_MARKS, HAND_CENTROIDS)
+POSE_NAMED = LandmarkLayout(POSE_COUNT, POSE_MARKS, POSE_CENTROIDS)
+
+
+def face_layout(mode=0):
+    return LandmarkLayout(FACE_COUNT) if mode else FACE_NAMED
+
+
+def hand_layout(mode=0):
+    return LandmarkLayout(HAND_COUNT) if mode else HAND_NAMED
+
+
+def pose_layout(mode=0):
+    return LandmarkLayout(POSE_COUNT) if mode else POSE_NAMED
+
+
+def onscreen(points):
+    xy = points[:, :2]
+    return ((xy >= 0.0) & (xy <= 1.0)).all(axis=1)
+
+
+def clamp(points):
+    np.clip(points[:, :2], 0.0, 1.0, out=points[:, :2])
+    return points
+
+
+def mirror(points):
+    # Flips x and y so that the origin is the bottom left corner of the
+    # mirrored camera image
+    np.subtract(1.0, points[:, :2], out=points[:, :2])
+    return points
+
+
+def postprocess(points, out=PASS):
+    # Applies the -o / --out policy and mirroring in place, returning the
+    # visibility mask of the rows (None when every row is sent)
+    visible = None
+    if out == INSIDE:
+        visible = onscreen(points)
+    elif out == CLAMP:
+        clamp(points)
+    mirror(points)
+    return visible
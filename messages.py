@@ -0,0 +1,137 @@
+#   Copyright 2024 Valerio Orlandini
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+# OSC messages of the trackers. Detection results are first turned into
+# lists of (slot, points) pairs, points being the raw (N, 3) landmark array
+# and slot the hand side (0 left, 1 right) for hands, or the detection
+# index otherwise. The send functions only depend on those lists, so that
+# recorded landmarks can be sent again without MediaPipe.
+#
+# When more faces, hands or people are tracked than the default, identify()
+# replaces the slots with persistent IDs (for hands, even IDs are left
+# hands and odd ones right hands) and the landmarks are sent under
+# /face/<id>/, /hands/<id>/ and /pose/<id>/.
+
+import numpy as np
+import landmarks as lmk
+
+
+HAND_SIDES = ("left", "right")
+
+
+def face_arrays(detection_result):
+    return [(i, lmk.to_array(face_landmarks))
+            for i, face_landmarks in enumerate(detection_result.face_landmarks)]
+
+
+def hand_arrays(detection_result):
+    return [(HAND_SIDES.index(str.lower(hand_handedness[0].category_name)),
+             lmk.to_array(detection_result.hand_landmarks[i]))
+            for i, hand_handedness in enumerate(detection_result.handedness)]
+
+
+def pose_arrays(detection_result):
+    return [(i, lmk.to_array(pose_landmarks))
+            for i, pose_landmarks in enumerate(detection_result.pose_landmarks)]
+
+
+def assign_ids(sets, identities, sides=False):
+    # Returns the ID of each set, -1 for the sets beyond the number of IDs
+    if not sets:
+        return np.empty(0, dtype=np.intp)
+    centroids = np.array([points[:, :2].mean(axis=0) for _, points in sets])
+    groups = [slot for slot, _ in sets] if sides else None
+    return identities.assign(centroids, groups)
+
+
+def relabel(sets, ids):
+    # Replaces the slots of sets with ids, given in the same order; also
+    # used for other per-detection values, such as face blendshapes
+    return [(int(id), values) for id, (_, values) in zip(ids, sets) if id >= 0]
+
+
+def identify(sets, identities, sides=False):
+    return relabel(sets, assign_ids(sets, identities, sides))
+
+
+def _send_identified(output, prefix, layout, sets, count, out=None):
+    present = set()
+    for id, landmarks in sets:
+        points = layout.select(landmarks)
+        if out is None:
+            lmk.mirror(points)
+            visible = None
+        else:
+            visible = lmk.postprocess(points, out)
+        output.send_landmarks(f"{prefix}/{id}", layout.names, points, visible)
+        present.add(id)
+
+    for id in range(count):
+        output.send_state(f"{prefix}/{id}/tracked/", int(id in present))
+
+    output.send_state(f"{prefix}/tracked/", len(sets))
+
+
+def send_face(output, layout, faces, count=1):
+    if count > 1:
+        _send_identified(output, "/face", layout, faces, count)
+        return
+
+    if len(faces) > 0:
+        points = layout.select(faces[0][1])
+        lmk.mirror(points)
+        output.send_landmarks("/face", layout.names, points)
+
+    output.send_state("/face/tracked/", len(faces))
+
+
+def send_hands(output, layout, hands, count=2):
+    if count > 2:
+        # One ID per hand and per side
+        _send_identified(output, "/hands", layout, hands, 2 * count)
+        return
+
+    # Only the first hand of each side is sent
+    handsfound = [False, False]
+
+    for slot, landmarks in hands:
+        hand_type = HAND_SIDES[slot]
+        if not handsfound[slot]:
+            output.send_state(
+                f"/hands/{hand_type}/tracked/", 1)
+            points = layout.select(landmarks)
+            lmk.mirror(points)
+            output.send_landmarks(
+                f"/hands/{hand_type}", layout.names, points)
+
+            handsfound[slot] = True
+
+    for slot, hand_type in enumerate(HAND_SIDES):
+        if not handsfound[slot]:
+            output.send_state(f"/hands/{hand_type}/tracked/", 0)
+
+    output.send_state("/hands/tracked/", len(hands))
+
+
+def send_pose(output, layout, poses, out=lmk.INSIDE, count=1):
+    if count > 1:
+        _send_identified(output, "/pose", layout, poses, count, out)
+        return
+
+    if len(poses) > 0:
+        points = layout.select(poses[0][1])
+        visible = lmk.postprocess(points, out)
+        output.send_landmarks("/pose", layout.names, points, visible)
+
+    output.send_state("/pose/tracked/", len(poses))
@@ -0,0 +1,165 @@
+#   Copyright 2024 Valerio Orlandini
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import adaptive as adapt
+import argparse
+import detection as det
+import draw_landmarks as draw
+import face_track
+import hands_track
+import identity as idt
+import landmarks as lmk
+import messages as msg
+import osc_output as osc
+import pipeline as pipe
+import prediction as pred
+import pose_track
+import recording as rec
+import stats as st
+
+
+TRACKERS = ("face", "hands", "pose")
+
+
+def multi_track(trackers=TRACKERS, width=640, height=480, address="127.0.0.1", port=8000, device=0, mode=0, out=lmk.INSIDE, compact=osc.SPLIT, bundle=False, deadband=0.0, keyframe=1.0, running=det.IMAGE, headless=False, preview_fps=0.0, record=None, stats=0.0, stats_port=None, scale=1.0, roi=0.0, target_fps=0.0, every=1, predict=0.0, targets=None, count=1, backend="any", fourcc=None, capture_fps=0.0, buffer_size=0, startup_report=False):
+    report = st.StartupReport() if startup_report else None
+
+    factories = {
+        "face": face_track.face_detector,
+        "hands": hands_track.hand_detector,
+        "pose": pose_track.pose_detector
+    }
+    # count is the number of people: as many faces and poses, twice the hands
+    counts = {"face": count, "hands": 2 * count, "pose": count}
+    # device is one index, or a list of them to track several cameras
+    devices = device if isinstance(device, (list, tuple)) else [device]
+    captures = pipe.open_captures(devices, width, height, backend, fourcc, capture_fps, buffer_size)
+    cameras = len(captures)
+    if report is not None:
+        report.mark("cameras")
+    detectors = det.camera_detectors(
+        lambda: det.DetectorGroup({name: factories[name](running, counts[name]) for name in trackers}),
+        cameras, running)
+    if report is not None:
+        report.mark("models")
+    det.warm_up(detectors, width, height)
+    if report is not None:
+        report.mark("warm-up")
+
+    face_layout = lmk.face_layout(mode)
+    hand_layout = lmk.hand_layout(mode)
+    pose_layout = lmk.pose_layout(mode)
+
+    def draw_landmarks(image, results, mirror=False):
+        if "face" in results:
+            draw.draw_face_landmarks_on_image(image, results["face"], mirror)
+        if "hands" in results:
+            draw.draw_hands_landmarks_on_image(image, results["hands"], mirror)
+        if "pose" in results:
+            draw.draw_pose_landmarks_on_image(image, results["pose"], mirror)
+        return image
+
+    def camera(n, capture, detector):
+        # Everything but the detectors is separate for each camera
+        prefix = pipe.camera_prefix(n, cameras)
+        output = osc.OscOutput(address, port, compact, bundle, deadband, keyframe, targets, prefix)
+
+        recorder = rec.Recorder(rec.camera_path(record, n, cameras), rec.stride(trackers)) if record else None
+
+        identities = {}
+        if count > 1:
+            identities = {rec.FACE: idt.Identities(count), rec.HANDS: idt.Identities(2 * count, 2),
+                          rec.POSE: idt.Identities(count)}
+
+        def messages(index, sets, measured):
+            output.send_value("/frame/", index)
+            if measured is not None:
+                output.send_value("/measured/", measured)
+            if rec.FACE in sets:
+                msg.send_face(output, face_layout, sets[rec.FACE], counts["face"])
+            if rec.HANDS in sets:
+                msg.send_hands(output, hand_layout, sets[rec.HANDS], counts["hands"])
+            if rec.POSE in sets:
+                msg.send_pose(output, pose_layout, sets[rec.POSE], out, counts["pose"])
+
+        sender = pipe.CameraOutput(output, messages, recorder, predict, report)
+
+        def send(frame):
+            results = frame.result
+            sets = {}
+            if "face" in results:
+                sets[rec.FACE] = msg.face_arrays(results["face"])
+            if "hands" in results:
+                sets[rec.HANDS] = msg.hand_arrays(results["hands"])
+            if "pose" in results:
+                sets[rec.POSE] = msg.pose_arrays(results["pose"])
+            for tracker, tracker_identities in identities.items():
+                if tracker in sets:
+                    sets[tracker] = msg.identify(sets[tracker], tracker_identities,
+                                                 tracker == rec.HANDS)
+            sender.send(frame, sets)
+
+        tracker_stats = st.Stats(prefix, output, stats, stats_port) if stats > 0 else None
+
+        pipeline = pipe.Pipeline(capture, adapt.wrap(detector, scale, roi, target_fps, every, running), send,
+                                 None if headless else draw_landmarks,
+                                 pipe.camera_title("Tracking", n, cameras), preview_fps,
+                                 stats=tracker_stats)
+        return pipeline, sender
+
+    try:
+        pipe.run_cameras(captures, detectors, camera)
+    finally:
+        det.close_all(detectors)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Face, hands and pose landmark tracker to OSC")
+    parser.add_argument(
+        '-t', '--trackers', help="trackers to run on each frame (default face hands pose)", nargs='+', choices=TRACKERS, default=list(TRACKERS))
+    parser.add_argument(
+        '-a', '--address', help="address to send OSC messages (default 127.0.0.1)", default="127.0.0.1")
+    parser.add_argument(
+        '-d', '--device', help="index of the video device to use (default 0); with several, each camera is tracked and sent under /cam/<n>/", type=int, nargs='+', default=0)
+    parser.add_argument(
+        '-m', '--mode', help="send a simplified and named list of the landmarks (0, default) or send all the numbered landmarks (1)", type=int, default=0)
+    parser.add_argument(
+        '-n', '--count', help="maximum number of people to track (default 1): as many faces and poses, twice as many hands; with more than 1, each one is sent under /face/<id>/, /hands/<id>/ and /pose/<id>/", type=int, default=1)
+    parser.add_argument(
+        '-p', '--port', help="port to send OSC messages (default 8000)", type=int, default=8000)
+    parser.add_argument(
+        '-s', '--size', help="width and height of the capture window", nargs=2, type=int, default=[640, 480], metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument(
+        '-o', '--out', help="pose tracking: do not send/update coordinates of the off-screen points (0), clamp their x/y inside [0.0, 1.0] (1) or pass them as they are (2, default)", type=int, default=2)
+    parser.add_argument(
+        '--record', help="also write the landmarks to a recording file, to be sent again with replay.py", metavar='FILE', default=None)
+    osc.add_arguments(parser)
+    st.add_arguments(parser)
+    det.add_arguments(parser)
+    adapt.add_arguments(parser)
+    pred.add_arguments(parser)
+    pipe.add_arguments(parser)
+    args = parser.parse_args()
+    adapt.check_arguments(parser, args)
+
+    multi_track(dict.fromkeys(args.trackers), args.size[0], args.size[1],
+                args.address, args.port, args.device, args.mode, args.out,
+                args.compact, args.bundle, args.deadband, args.keyframe,
+                args.running, args.headless, args.preview_fps, args.record,
+                args.stats, args.stats_port,
+                args.scale, args.roi, args.target_fps, args.every,
+                args.predict, args.target, args.count,
+                args.backend, args.fourcc, args.capture_fps, args.buffer_size,
+                args.startup_report)
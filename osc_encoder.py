@@ -0,0 +1,117 @@
+#   Copyright 2024 Valerio Orlandini
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+# OSC 1.0 encoding for the fixed address sets sent by the trackers.
+# Every message is encoded once, at startup, as a bundle element (a 4 bytes
+# big-endian size followed by the message), so that the same bytes can be
+# sent alone or copied inside a bundle. At runtime only the argument slots
+# are overwritten in place.
+
+import struct
+import numpy as np
+
+
+SPLIT = 0
+POINT = 1
+ARRAY = 2
+
+BUNDLE_HEADER = b"#bundle\x00"
+NTP_EPOCH = 2208988800
+
+
+def osc_string(value):
+    data = value.encode("utf-8") + b"\x00"
+    return data + b"\x00" * (-len(data) % 4)
+
+
+def encode_element(address, tags):
+    # Returns the element bytes and the offset of the first argument
+    head = osc_string(address) + osc_string("," + tags)
+    size = len(head) + 4 * len(tags)
+    return struct.pack(">i", size) + head + bytes(4 * len(tags)), 4 + len(head)
+
+
+def write_timetag(buffer, offset, timestamp):
+    seconds = int(timestamp)
+    fraction = int((timestamp - seconds) * 4294967296.0) & 0xFFFFFFFF
+    struct.pack_into(">II", buffer, offset, seconds + NTP_EPOCH, fraction)
+
+
+class Message:
+    def __init__(self, address, tags):
+        data, self.args_offset = encode_element(address, tags)
+        self.data = bytearray(data)
+        self.element = memoryview(self.data)
+        self.message = self.element[4:]
+        self._format = ">" + tags
+
+    def write(self, *values):
+        struct.pack_into(self._format, self.data, self.args_offset, *values)
+
+
+class LandmarkBlock:
+    def __init__(self, prefix, names, schema=SPLIT):
+        self.prefix = prefix
+        self.names = [str(name) for name in names]
+        self.schema = schema
+        self.size = len(self.names)
+        self.sent = False
+
+        if schema == ARRAY:
+            elements = [encode_element(f"{prefix}/landmarks/", "f" * (3 * self.size))]
+        elif schema == POINT:
+            elements = [encode_element(f"{prefix}/{name}/", "fff")
+                        for name in self.names]
+        else:
+            elements = [encode_element(f"{prefix}/{name}/{axis}/", "f")
+                        for name in self.names for axis in "xyz"]
+
+        self.data = bytearray(b"".join(data for data, _ in elements))
+        view = memoryview(self.data)
+        self.elements = []
+        self.messages = []
+        index = []
+        start = 0
+        for data, args_offset in elements:
+            end = start + len(data)
+            self.elements.append(view[start:end])
+            self.messages.append(view[start + 4:end])
+            first = start + args_offset
+            index.extend(range(first, end))
+            start = end
+
+        # Byte positions of every float slot, in (landmark, axis) order, so
+        # that a whole (N, 3) big-endian array can be scattered at once
+        self._index = np.asarray(index, dtype=np.intp)
+        self._bytes = np.frombuffer(self.data, dtype=np.uint8)
+        self._values = np.zeros((self.size, 3), dtype=">f4")
+        self._values_bytes = self._values.reshape(-1).view(np.uint8)
+        self._per_landmark = len(self.elements) // max(self.size, 1)
+
+    def write(self, coords, visible=None):
+        if visible is None or not self.sent:
+            np.copyto(self._values, coords, casting="unsafe")
+        else:
+            visible = np.asarray(visible, dtype=bool)
+            np.copyto(self._values, coords, casting="unsafe", where=visible[:, None])
+        self._bytes[self._index] = self._values_bytes
+        self.sent = True
+
+    def selected(self, views, visible):
+        # Elements (or messages) of the visible landmarks only
+        if visible is None or self.schema == ARRAY:
+            return views
+        step = self._per_landmark
+        return [view for i, flag in enumerate(visible) if flag
+                for view in views[i * step:(i + 1) * step]]
@@ -0,0 +1,339 @@
+#   Copyright 2024 Valerio Orlandini
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import argparse
+import numbers
+import socket
+import time
+import numpy as np
+import osc_encoder as enc
+
+
+# Message schemas, selected with the -c / --compact option:
+# 0 sends x, y and z of each landmark as three separate messages
+# 1 sends one message per landmark carrying x, y and z
+# 2 sends one message per landmark set carrying x, y and z of all its landmarks
+SPLIT = enc.SPLIT
+POINT = enc.POINT
+ARRAY = enc.ARRAY
+
+# Largest payload of a single UDP datagram over IPv4
+MAX_DATAGRAM = 65507
+
+# Transports of the --target option
+UDP = "udp"
+TCP = "tcp"
+
+# SLIP framing of OSC 1.1 packets over TCP
+SLIP_END = b"\xc0"
+SLIP_ESC = b"\xdb"
+SLIP_ESC_END = b"\xdb\xdc"
+SLIP_ESC_ESC = b"\xdb\xdd"
+
+# Bytes waiting to be sent to a TCP receiver, beyond which new packets are
+# dropped, and seconds between connection attempts
+MAX_TCP_BUFFER = 4 * 1024 * 1024
+RECONNECT = 1.0
+# Seconds given to the bytes still queued to a TCP receiver when closing
+CLOSE_TIMEOUT = 1.0
+
+
+def parse_target(text):
+    # host:port for UDP, udp://host:port or tcp://host:port
+    protocol, separator, rest = text.partition("://")
+    if not separator:
+        protocol, rest = UDP, text
+    host, separator, port = rest.rpartition(":")
+    if protocol not in (UDP, TCP) or not separator or not host or not port.isdigit():
+        raise argparse.ArgumentTypeError(
+            f"invalid target '{text}', expected host:port, udp://host:port or tcp://host:port")
+    return protocol, host, int(port)
+
+
+def parse_deadband(text):
+    # VALUE for every landmark, or NAME=VALUE for the landmarks named NAME
+    # (such as nose, or 0 with -m 1) of every set; returns (name, value),
+    # name being None for every landmark
+    name, separator, value = text.rpartition("=")
+    try:
+        return (name if separator else None), float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"invalid deadband '{text}', expected a number or NAME=NUMBER such as nose=0.005")
+
+
+class TcpTarget:
+    # OSC 1.1 stream transport: packets are SLIP encoded, with an END byte
+    # on both sides, and queued in a send buffer drained without blocking.
+    # When the receiver is too slow the buffer fills up and new packets are
+    # dropped; when it is unreachable, connection is attempted again every
+    # RECONNECT seconds.
+    def __init__(self, host, port, max_buffer=MAX_TCP_BUFFER):
+        self.address = (socket.gethostbyname(host), port)
+        self.max_buffer = max_buffer
+        self.buffer = bytearray()
+        self.sock = None
+        self._retry = 0.0
+
+    def _connect(self):
+        now = time.monotonic()
+        if now < self._retry:
+            return
+        self._retry = now + RECONNECT
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # The connection completes in the background
+        sock.connect_ex(self.address)
+        self.sock = sock
+
+    def _close(self):
+        self.sock.close()
+        self.sock = None
+        self.buffer.clear()
+
+    def send(self, data):
+        # Returns the number of bytes queued
+        if self.sock is None:
+            self._connect()
+            if self.sock is None:
+                return 0
+        packet = (SLIP_END + bytes(data).replace(SLIP_ESC, SLIP_ESC_ESC)
+                  .replace(SLIP_END, SLIP_ESC_END) + SLIP_END)
+        if len(self.buffer) + len(packet) > self.max_buffer:
+            self.flush()
+            return 0
+        self.buffer += packet
+        return len(packet) if self.flush() else 0
+
+    def flush(self):
+        # Sends as much of the queued bytes as the socket takes without
+        # blocking; also called after every frame, so that the rest of a
+        # partial send does not wait for the next packet. Returns False if
+        # the connection was lost
+        if self.sock is None or not self.buffer:
+            return self.sock is not None
+        try:
+            sent = self.sock.send(self.buffer)
+        except BlockingIOError:
+            # Still connecting or the socket buffer is full
+            return True
+        except OSError:
+            self._close()
+            return False
+        del self.buffer[:sent]
+        return True
+
+    def close(self):
+        if self.sock is None:
+            return
+        if self.buffer:
+            try:
+                self.sock.settimeout(CLOSE_TIMEOUT)
+                self.sock.sendall(self.buffer)
+            except OSError:
+                pass
+        self._close()
+
+
+class OscOutput:
+    # With a deadband greater than 0, only the landmarks that moved by more
+    # than the deadband on any axis since they were last sent, and the states
+    # that changed, are sent. deadband can also be a list of (name, value)
+    # pairs as returned by parse_deadband, giving the landmarks with that
+    # name their own deadband. Everything is sent again every keyframe
+    # seconds (never if 0), so that receivers started later can catch up.
+    # sent_messages and sent_bytes count the OSC messages and the bytes sent.
+    # targets, a list of (protocol, host, port) as returned by parse_target,
+    # replaces address and port: packets are encoded once and sent to every
+    # target, UDP ones from a single non-blocking socket, so that a slow or
+    # unreachable receiver never stalls the tracker. prefix is prepended to
+    # every address, such as /cam/1 for the messages of a second camera.
+    def __init__(self, address="127.0.0.1", port=8000, compact=SPLIT, bundle=False, deadband=0.0, keyframe=1.0, targets=None, prefix=""):
+        self.targets = list(targets) if targets else [(UDP, address, port)]
+        self._udp = [(socket.gethostbyname(host), port)
+                     for protocol, host, port in self.targets if protocol == UDP]
+        self._tcp = [TcpTarget(host, port)
+                     for protocol, host, port in self.targets if protocol == TCP]
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.prefix = prefix
+        self.compact = compact
+        self.bundle = bundle
+        if isinstance(deadband, numbers.Real):
+            self.deadband = deadband
+            self.deadbands = {}
+        else:
+            deadbands = dict(deadband)
+            self.deadband = deadbands.pop(None, 0.0)
+            self.deadbands = deadbands
+        self.filtered = bool(self.deadband or self.deadbands)
+        self.keyframe = keyframe
+        self._thresholds = {}
+        self._sent = {}
+        self._states = {}
+        self._keyframe = True
+        self._next_keyframe = 0.0
+        self._blocks = {}
+        self._messages = {}
+        self._frame = bytearray(MAX_DATAGRAM)
+        self._frame[:8] = enc.BUNDLE_HEADER
+        self._frame_view = memoryview(self._frame)
+        self._timestamp = 0.0
+        self._pos = 0
+        self.sent_messages = 0
+        self.sent_bytes = 0
+
+    def begin_frame(self, timestamp=None):
+        if self.filtered:
+            now = time.monotonic()
+            self._keyframe = self.keyframe > 0 and now >= self._next_keyframe
+            if self._keyframe:
+                self._next_keyframe = now + self.keyframe
+        if self.bundle:
+            self._timestamp = time.time() if timestamp is None else timestamp
+            self._pos = 16
+
+    def end_frame(self):
+        if self._pos:
+            self._flush()
+            self._pos = 0
+        for target in self._tcp:
+            target.flush()
+
+    def _flush(self):
+        if self._pos > 16:
+            enc.write_timetag(self._frame, 8, self._timestamp)
+            self._send(self._frame_view[:self._pos])
+        self._pos = 16
+
+    def _send(self, data):
+        for target in self._udp:
+            try:
+                self.sent_bytes += self.sock.sendto(data, target)
+            except OSError:
+                # Full socket buffer or unreachable receiver: the packet is
+                # dropped
+                pass
+        for target in self._tcp:
+            self.sent_bytes += target.send(data)
+
+    def _emit(self, elements, messages):
+        # Elements are copied inside the current bundle, messages are sent
+        # on their own when no bundle is open
+        if not self._pos:
+            for message in messages:
+                self._send(message)
+            self.sent_messages += len(messages)
+            return
+        self.sent_messages += len(elements)
+        for element in elements:
+            size = len(element)
+            if self._pos + size > MAX_DATAGRAM:
+                self._flush()
+            self._frame[self._pos:self._pos + size] = element
+            self._pos += size
+
+    def send(self, address, *values):
+        tags = "".join("i" if isinstance(value, numbers.Integral) else "f"
+                       for value in values)
+        key = (address, tags)
+        message = self._messages.get(key)
+        if message is None:
+            message = self._messages[key] = enc.Message(self.prefix + address, tags)
+        message.write(*values)
+        self._emit((message.element,), (message.message,))
+
+    def send_value(self, address, value):
+        self.send(address, value)
+
+    def send_state(self, address, value):
+        # Like send_value, but with a deadband only sent when it changes
+        if self.filtered:
+            if not self._keyframe and self._states.get(address) == value:
+                return
+            self._states[address] = value
+        self.send(address, value)
+
+    def _threshold(self, prefix, names):
+        # Deadband of each landmark of a set, as a column
+        if not self.deadbands:
+            return self.deadband
+        thresholds = self._thresholds.get(prefix)
+        if thresholds is None or len(thresholds) != len(names):
+            thresholds = self._thresholds[prefix] = np.array(
+                [self.deadbands.get(str(name), self.deadband) for name in names],
+                dtype=np.float32).reshape(-1, 1)
+        return thresholds
+
+    def _changed(self, prefix, names, coords, visible):
+        coords = np.asarray(coords, dtype=np.float32)
+        last = self._sent.get(prefix)
+        if last is None or last.shape != coords.shape:
+            # NaN until a row is first sent, so that rows hidden by visible
+            # are sent as soon as they show up
+            last = self._sent[prefix] = np.full_like(coords, np.nan)
+        if self._keyframe:
+            changed = np.ones(len(coords), dtype=bool)
+        else:
+            threshold = self._threshold(prefix, names)
+            changed = ~(np.abs(coords - last) <= threshold).all(axis=1)
+        if visible is not None:
+            changed &= visible
+        np.copyto(last, coords, where=changed[:, None])
+        return changed
+
+    def send_landmarks(self, prefix, names, coords, visible=None):
+        # coords holds one (x, y, z) row per name; rows whose visible flag is
+        # False are not updated: they are skipped by the per-landmark schemas
+        # and keep their last sent value inside the array schema
+        if self.filtered:
+            visible = self._changed(prefix, names, coords, visible)
+            if visible.all():
+                visible = None
+            elif not visible.any():
+                return
+        block = self._blocks.get(prefix)
+        if block is None or block.size != len(names):
+            block = self._blocks[prefix] = enc.LandmarkBlock(
+                self.prefix + prefix, names, self.compact)
+        block.write(coords, visible)
+        size = len(block.data)
+        if self._pos and visible is None and self._pos + size <= MAX_DATAGRAM:
+            # The elements of a block are contiguous: copy them all at once
+            self._frame[self._pos:self._pos + size] = block.data
+            self._pos += size
+            self.sent_messages += len(block.elements)
+        elif self._pos:
+            self._emit(block.selected(block.elements, visible), ())
+        else:
+            self._emit((), block.selected(block.messages, visible))
+
+    def close(self):
+        for target in self._tcp:
+            target.close()
+        self.sock.close()
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        '--target', help="send the OSC messages to this destination instead of -a and -p: host:port or udp://host:port for UDP, tcp://host:port for OSC 1.1 over TCP; repeat it to send to several destinations", type=parse_target, action='append', metavar='HOST:PORT')
+    parser.add_argument(
+        '-b', '--bundle', help="wrap the messages of each frame in a single timestamped OSC bundle", action='store_true')
+    parser.add_argument(
+        '-c', '--compact', help="send x, y and z as separate messages (0, default), one message per landmark (1) or one message for the whole landmark set (2)", type=int, choices=(SPLIT, POINT, ARRAY), default=SPLIT)
+    parser.add_argument(
+        '-e', '--deadband', help="only send the landmarks that moved by more than this amount and the states that changed (default 0, send everything on every frame); NAME=VALUE sets the deadband of the landmarks named NAME, such as nose=0.002 or 0=0.002 with -m 1", nargs='+', type=parse_deadband, default=0.0, metavar='DEADBAND')
+    parser.add_argument(
+        '-k', '--keyframe', help="with a deadband, send everything again every this many seconds (default 1, 0 never)", type=float, default=1.0)
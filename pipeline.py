@@ -0,0 +1,442 @@
+#   Copyright 2024 Valerio Orlandini
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+# Threaded tracker pipeline: capture -> inference -> OSC, plus an optional
+# preview shown from the main thread. Stages are connected by bounded
+# queues that drop their oldest item when full, so a slow stage never makes
+# the others wait and the latency from camera to OSC stays bounded.
+
+import argparse
+import collections
+import threading
+import time
+import cv2
+import numpy as np
+import prediction as pred
+import recording as rec
+
+
+MAX_FAILURES = 50
+
+# Values of the --backend option
+BACKENDS = {
+    "any": cv2.CAP_ANY,
+    "v4l2": cv2.CAP_V4L2,
+    "ffmpeg": cv2.CAP_FFMPEG,
+    "gstreamer": cv2.CAP_GSTREAMER,
+    "dshow": cv2.CAP_DSHOW,
+    "msmf": cv2.CAP_MSMF,
+    "avfoundation": cv2.CAP_AVFOUNDATION
+}
+
+
+class Empty(Exception):
+    pass
+
+
+class LatestQueue:
+    # on_drop(item), when given, is called with each item dropped
+    def __init__(self, maxsize=1, on_drop=None):
+        self._items = collections.deque(maxlen=maxsize)
+        self._ready = threading.Condition()
+        self.on_drop = on_drop
+        self.dropped = 0
+
+    def put(self, item):
+        with self._ready:
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+                if self.on_drop is not None:
+                    self.on_drop(self._items[0])
+            self._items.append(item)
+            self._ready.notify()
+
+    def get(self, timeout=None):
+        with self._ready:
+            if not self._items and not self._ready.wait_for(lambda: self._items, timeout):
+                raise Empty
+            return self._items.popleft()
+
+
+class Frame:
+    # buffers is the [bgr, rgb] pair of reused images the frame was captured
+    # into, if any, and holds the number of stages still using it
+    __slots__ = ("index", "timestamp", "bgr", "rgb", "result", "stages", "buffers", "holds")
+
+    def __init__(self, index, timestamp, bgr, rgb):
+        self.index = index
+        self.timestamp = timestamp
+        self.bgr = bgr
+        self.rgb = rgb
+        self.result = None
+        self.stages = None
+        self.buffers = None
+        self.holds = 0
+
+
+class Pipeline:
+    # detector is a detection.Detector, send(frame) sends the detection
+    # result of a frame over OSC and draw(image, result, mirror), when given,
+    # draws the landmarks in place on the mirrored BGR preview image, at most
+    # preview_fps times per second (0 previews every frame). With profile,
+    # frame.stages holds the seconds spent by the frame in the capture,
+    # convert and inference stages. stats, a stats.Stats, is updated after
+    # each frame is sent and reads the counters of the pipeline
+    def __init__(self, capture, detector, send, draw=None, title="Tracking", preview_fps=0, profile=False, stats=None):
+        self.capture = capture
+        self.detector = detector
+        self.send = send
+        self.draw = draw
+        self.title = title
+        self.preview_interval = 1.0 / preview_fps if preview_fps > 0 else 0.0
+        self.profile = profile or stats is not None
+        self.stats = stats
+        self.captured = 0
+        self.failures = 0
+        self.fail_counter = 0
+        self.frames = LatestQueue(1, self._release)
+        self.results = LatestQueue(2)
+        self.previews = LatestQueue(1, self._release)
+        self.stop = threading.Event()
+        self.error = None
+        self._image = None
+        self._next_preview = 0.0
+        # Frames are read and converted into buffers taken from a free list,
+        # and given back once the inference and the preview are done with
+        # them; _undelivered holds the frames waiting for their result
+        # before being previewed
+        self._free = []
+        self._undelivered = collections.deque()
+        self._buffers_lock = threading.Lock()
+
+    def _stage(self, target):
+        def run():
+            try:
+                target()
+            except Exception as error:
+                self.error = error
+            finally:
+                self.stop.set()
+        return threading.Thread(target=run, name=target.__name__, daemon=True)
+
+    def _take_buffers(self):
+        with self._buffers_lock:
+            return self._free.pop() if self._free else [None, None]
+
+    def _release(self, frame):
+        with self._buffers_lock:
+            self._release_locked(frame)
+
+    def _release_locked(self, frame):
+        frame.holds -= 1
+        if frame.holds <= 0 and frame.buffers is not None:
+            self._free.append(frame.buffers)
+            frame.buffers = None
+
+    def _capture_loop(self):
+        # Captures such as frame_ring.RingCapture already deliver RGB frames
+        rgb_capture = getattr(self.capture, "rgb", False)
+        # OpenCV captures can read into an existing image
+        reuse = isinstance(self.capture, cv2.VideoCapture)
+        index = 0
+        while not self.stop.is_set():
+            start = time.perf_counter()
+            buffers = self._take_buffers()
+            try:
+                if reuse:
+                    success, img = self.capture.read(buffers[0])
+                    buffers[0] = img
+                else:
+                    success, img = self.capture.read()
+            except Exception:
+                success = False
+            if not success or rgb_capture:
+                with self._buffers_lock:
+                    self._free.append(buffers)
+                buffers = None
+            if not success:
+                # Captures such as frame_ring.RingCapture tell the end of
+                # the stream and the wait for a new frame from a failure
+                if getattr(self.capture, "ended", False):
+                    return
+                if getattr(self.capture, "waiting", False):
+                    continue
+                self.failures += 1
+                self.fail_counter += 1
+                if self.fail_counter < MAX_FAILURES:
+                    continue
+                print("Unable to capture from camera: too many failed attempts")
+                return
+            self.fail_counter = 0
+            self.captured += 1
+
+            timestamp = time.time()
+            captured = time.perf_counter()
+            if rgb_capture:
+                frame = Frame(index, timestamp, None, img)
+            else:
+                rgb = buffers[1]
+                if rgb is None or rgb.shape != img.shape:
+                    rgb = buffers[1] = np.empty_like(img)
+                frame = Frame(index, timestamp, img,
+                              cv2.cvtColor(img, cv2.COLOR_BGR2RGB, dst=rgb))
+                # Held by the inference and, until its result is delivered,
+                # by the preview
+                frame.buffers = buffers
+                frame.holds = 1
+                if self.draw is not None:
+                    frame.holds = 2
+                    with self._buffers_lock:
+                        self._undelivered.append(frame)
+            if self.profile:
+                frame.stages = {"capture": captured - start,
+                                "convert": time.perf_counter() - captured}
+            self.frames.put(frame)
+            index += 1
+
+    def _inference_loop(self):
+        while not self.stop.is_set():
+            try:
+                frame = self.frames.get(0.1)
+            except Empty:
+                continue
+            if frame.stages is not None:
+                # Replaced by the inference time once the result is delivered
+                frame.stages["inference"] = time.perf_counter()
+            self.detector.detect(frame, self._deliver)
+            # MediaPipe copies the image it is given, also in LIVE_STREAM
+            # mode, so the inference is done with the buffers
+            self._release(frame)
+
+    def _deliver(self, frame):
+        if frame.stages is not None:
+            frame.stages["inference"] = time.perf_counter() - frame.stages["inference"]
+        self.results.put(frame)
+        if self.draw is not None:
+            with self._buffers_lock:
+                # Older frames were skipped or dropped by the detector and
+                # will never be previewed
+                while self._undelivered and self._undelivered[0].index < frame.index:
+                    self._release_locked(self._undelivered.popleft())
+                if self._undelivered and self._undelivered[0] is frame:
+                    self._undelivered.popleft()
+            self.previews.put(frame)
+
+    def _send_loop(self):
+        while not self.stop.is_set():
+            try:
+                frame = self.results.get(0.1)
+            except Empty:
+                continue
+            self.send(frame)
+            if self.stats is not None:
+                self.stats.update(self, frame)
+
+    def start(self):
+        threads = [self._stage(self._capture_loop),
+                   self._stage(self._inference_loop),
+                   self._stage(self._send_loop)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def run(self):
+        run([self])
+
+    def _preview(self):
+        # Shows the last processed frame, if any, in the window of the
+        # pipeline
+        try:
+            frame = self.previews.get(0.0)
+        except Empty:
+            return False
+        now = time.monotonic()
+        if now < self._next_preview:
+            self._release(frame)
+            return True
+        self._next_preview = now + self.preview_interval
+        # The captured frame is flipped into a reused buffer and the
+        # landmarks are mirrored in coordinate space
+        if self._image is None or self._image.shape != frame.rgb.shape:
+            self._image = np.empty_like(frame.rgb)
+        image = self._image
+        if frame.bgr is None:
+            cv2.cvtColor(frame.rgb, cv2.COLOR_RGB2BGR, dst=image)
+            cv2.flip(image, 1, dst=image)
+        else:
+            cv2.flip(frame.bgr, 1, dst=image)
+        self._release(frame)
+        self.draw(image, frame.result, True)
+        cv2.imshow(self.title, image)
+        return True
+
+
+def run(pipelines):
+    # Runs the pipelines of one or more cameras until all of them stop, a
+    # key is pressed in a preview window or Ctrl+C is hit
+    threads = []
+    for pipeline in pipelines:
+        threads += pipeline.start()
+    previews = [pipeline for pipeline in pipelines if pipeline.draw is not None]
+
+    try:
+        while not all(pipeline.stop.is_set() for pipeline in pipelines):
+            if not previews:
+                time.sleep(0.1)
+                continue
+            shown = False
+            for pipeline in previews:
+                shown |= pipeline._preview()
+            if cv2.waitKey(1) != -1:
+                break
+            if not shown:
+                time.sleep(0.005)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pipeline in pipelines:
+            pipeline.stop.set()
+        for thread in threads:
+            thread.join()
+
+    for pipeline in pipelines:
+        if pipeline.error is not None:
+            raise pipeline.error
+
+
+class CameraOutput:
+    # The sending side of the pipeline of one camera. messages(index, sets,
+    # measured) sends the OSC messages of a frame to output from its sets, a
+    # dictionary of (slot, points) lists by tracker (as the recording module
+    # uses) or by feature set; send(frame, sets) records the trackers of the
+    # sets and sends them at once or, with predict > 0, through a predictor
+    # emitting predict frames per second
+    def __init__(self, output, messages, recorder=None, predict=0.0, report=None):
+        self.output = output
+        self.messages = messages
+        self.recorder = recorder
+        self.report = report
+        self.predictor = pred.Predictor(self.emit, predict) if predict > 0 else None
+        if self.predictor is not None:
+            self.predictor.start()
+
+    def emit(self, index, timestamp, sets, measured=None):
+        self.output.begin_frame(timestamp)
+        self.messages(index, sets, measured)
+        self.output.end_frame()
+        if self.report is not None:
+            self.report.sent()
+
+    def send(self, frame, sets):
+        if self.recorder is not None:
+            for tracker in (rec.FACE, rec.HANDS, rec.POSE):
+                if tracker in sets:
+                    self.recorder.write(frame.timestamp, tracker, sets[tracker])
+        if self.predictor is not None:
+            self.predictor.measure(frame.index, frame.timestamp, sets)
+        else:
+            self.emit(frame.index, frame.timestamp, sets)
+
+    def close(self):
+        if self.predictor is not None:
+            self.predictor.stop()
+        if self.recorder is not None:
+            self.recorder.close()
+        self.output.close()
+
+
+def run_cameras(captures, detectors, camera):
+    # camera(n, capture, detector) returns the Pipeline and the CameraOutput
+    # of a camera. The outputs are closed and the captures released however
+    # the pipelines stop, a stage raising included
+    outputs = []
+    try:
+        pipelines = []
+        for n, (capture, detector) in enumerate(zip(captures, detectors)):
+            pipeline, output = camera(n, capture, detector)
+            pipelines.append(pipeline)
+            outputs.append(output)
+        run(pipelines)
+    finally:
+        for output in outputs:
+            output.close()
+        for capture in captures:
+            capture.release()
+
+
+def open_captures(devices, width=640, height=480, backend="any", fourcc=None, fps=0.0, buffer_size=0):
+    # fourcc, such as MJPG, is the pixel format asked to the camera, fps its
+    # frame rate and buffer_size the number of frames it queues (0 keeps
+    # the defaults); the values actually used are printed for each camera
+    captures = []
+    for device in devices:
+        capture = cv2.VideoCapture(device, BACKENDS[backend])
+        # The format goes first, as it sets the sizes and rates available
+        if fourcc:
+            capture.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc))
+        capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        if fps > 0:
+            capture.set(cv2.CAP_PROP_FPS, fps)
+        if buffer_size > 0:
+            capture.set(cv2.CAP_PROP_BUFFERSIZE, buffer_size)
+        print(f"Camera {device}: {describe_capture(capture)}")
+        captures.append(capture)
+    return captures
+
+
+def parse_fourcc(text):
+    if len(text) != 4:
+        raise argparse.ArgumentTypeError(
+            f"invalid FOURCC '{text}', expected four characters such as MJPG or YUYV")
+    return text
+
+
+def describe_capture(capture):
+    if not capture.isOpened():
+        return "not opened"
+    code = int(capture.get(cv2.CAP_PROP_FOURCC))
+    fourcc = "".join(chr((code >> 8 * i) & 0xFF) for i in range(4)) if code > 0 else "unknown format"
+    buffer_size = int(capture.get(cv2.CAP_PROP_BUFFERSIZE))
+    return (f"{int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))}x{int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))}"
+            f" at {capture.get(cv2.CAP_PROP_FPS):g} fps, {fourcc}, {capture.getBackendName()} backend,"
+            f" buffer of {buffer_size if buffer_size > 0 else 'unknown'} frames")
+
+
+def camera_prefix(camera, cameras):
+    # OSC prefix of the messages of a camera, when there are several
+    return f"/cam/{camera}" if cameras > 1 else ""
+
+
+def camera_title(title, camera, cameras):
+    return f"{title} - Camera {camera}" if cameras > 1 else title
+
+
+def add_capture_arguments(parser):
+    parser.add_argument(
+        '--backend', help="video capture backend (default any, the first one that works)", choices=BACKENDS, default="any")
+    parser.add_argument(
+        '--fourcc', help="pixel format to ask the camera, such as MJPG to reach higher frame rates at large sizes (default: the camera default)", type=parse_fourcc, default=None, metavar='CODE')
+    parser.add_argument(
+        '--capture-fps', help="frame rate to ask the camera (default 0, the camera default)", type=float, default=0.0, metavar='FPS')
+    parser.add_argument(
+        '--buffer-size', help="number of frames queued by the capture backend, 1 for the lowest latency (default 0, the backend default)", type=int, default=0, metavar='FRAMES')
+
+
+def add_arguments(parser):
+    add_capture_arguments(parser)
+    parser.add_argument(
+        '--headless', help="do not open the preview window nor draw the landmarks (quit with Ctrl+C)", action='store_true')
+    parser.add_argument(
+        '--preview-fps', help="maximum frame rate of the preview window (default 0, every frame)", type=float, default=0.0)
@@ -12,173 +12,89 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
+import adaptive as adapt
 import argparse
-import cv2
+import detection as det
 import draw_landmarks as draw
-import mediapipe as mp
-from mediapipe.tasks import python
-from mediapipe.tasks.python import vision
-import numpy as np
-from pythonosc import udp_client
-
-
-def pose_track(width=640, height=480, address="127.0.0.1", port=8000, device=0, mode=0, out=0):
-    base_options = python.BaseOptions(
-        model_asset_path='models/pose_landmarker.task')
-    options = vision.PoseLandmarkerOptions(base_options=base_options,
-                                           output_segmentation_masks=False)
-    detector = vision.PoseLandmarker.create_from_options(options)
-
-    capture = cv2.VideoCapture(device)
-
-    client = udp_client.SimpleUDPClient(address, port)
-
-    pose_marks = {
-        "nose": 0,
-        "lefteye": 2,
-        "righteye": 5,
-        "leftear": 7,
-        "rightear": 8,
-        "leftshoulder": 11,
-        "rightshoulder": 12,
-        "leftelbow": 13,
-        "rightelbow": 14,
-        "leftwrist": 15,
-        "rightwrist": 16,
-        "leftpinky": 17,
-        "rightpinky": 18,
-        "leftindex": 19,
-        "rightindex": 20,
-        "leftthumb": 21,
-        "rightthumb": 22,
-        "lefthip": 23,
-        "righthip": 24,
-        "leftknee": 25,
-        "rightknee": 26,
-        "leftankle": 27,
-        "rightankle": 28,
-        "leftheel": 29,
-        "rightheel": 30,
-        "leftfootindex": 31,
-        "rightfootindex": 32
-    }
-
-    fail_counter = 0
-
-    capture.set(3, width)
-    capture.set(4, height)
-
-    while cv2.waitKey(1) == -1:
-        try:
-            success, img = capture.read()
-            if not success:
-                fail_counter += 1
-                if (fail_counter < 50):
-                    continue
-                else:
-                    print("Unable to capture from camera: too many failed attempts")
-                    break
-        except:
-            fail_counter += 1
-            if (fail_counter < 50):
-                continue
-            else:
-                print("Unable to capture from camera: too many failed attempts")
-                break
-        fail_counter = 0
-
-        imgRGB = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-
-        image = mp.Image(image_format=mp.ImageFormat.SRGB, data=imgRGB)
-        detection_result = detector.detect(image)
-
-        clamp = (out == 1)
-        inside = (out == 0)
-        
-        if len(detection_result.pose_landmarks) > 0:
-            if mode:
-                for idx, lm in enumerate(detection_result.pose_landmarks[0]):
-                    x = lm.x
-                    y = lm.y
-                    z = lm.z
-                    if not (0.0 <= x <= 1.0 and 0.0 <= y <= 1.0) and inside:
-                        continue
-                    if clamp:
-                        x = min(0.0, max(x, 1.0))
-                        y = min(0.0, max(y, 1.0))
-                    client.send_message(
-                        f"/pose/{idx}/x/", x)
-                    client.send_message(
-                        f"/pose/{idx}/y/", y)
-                    client.send_message(
-                        f"/pose/{idx}/z/", z)
-            else:
-                for key, idx in pose_marks.items():
-                    lm = detection_result.pose_landmarks[0][idx]                    
-                    x = lm.x
-                    y = lm.y
-                    z = lm.z
-                    if not (0.0 <= x <= 1.0 and 0.0 <= y <= 1.0) and inside:
-                        continue
-                    if clamp:
-                        x = min(0.0, max(x, 1.0))
-                        y = min(0.0, max(y, 1.0))
-                    client.send_message(
-                        f"/pose/{key}/x/", 1.0 - x)
-                    client.send_message(
-                        f"/pose/{key}/y/", 1.0 - y)
-                    client.send_message(
-                        f"/pose/{key}/z/", z)
-
-                mouth_around = []
-                for i in (9, 10):
-                    lm = detection_result.pose_landmarks[0][i]
-                    mouth_around.append((lm.x, lm.y, lm.z))
-                ma_array = np.array(mouth_around)
-                mouth_coords = ma_array.mean(axis=0)
-                x = mouth_coords[0]
-                y = mouth_coords[1]
-                z = mouth_coords[2]
-                if ((0.0 <= x <= 1.0 and 0.0 <= y <= 1.0) and inside) or not inside:
-                    if clamp:
-                        x = min(0.0, max(x, 1.0))
-                        y = min(0.0, max(y, 1.0))
-                    client.send_message(
-                        f"/pose/mouth/x/", 1.0 - mouth_coords[0])
-                    client.send_message(
-                        f"/pose/mouth/y/", 1.0 - mouth_coords[1])
-                    client.send_message(
-                        f"/pose/mouth/z/", mouth_coords[2])
-
-                torso_around = []
-                for i in (11, 12, 23, 24):
-                    lm = detection_result.pose_landmarks[0][i]
-                    torso_around.append((lm.x, lm.y, lm.z))
-                ta_array = np.array(torso_around)
-                torso_coords = ta_array.mean(axis=0)
-                x = torso_coords[0]
-                y = torso_coords[1]
-                z = torso_coords[2]
-                if ((0.0 <= x <= 1.0 and 0.0 <= y <= 1.0) and inside) or not inside:
-                    if clamp:
-                        x = min(0.0, max(x, 1.0))
-                        y = min(0.0, max(y, 1.0))
-                    client.send_message(
-                        f"/pose/torso/x/", 1.0 - x)
-                    client.send_message(
-                        f"/pose/torso/y/", 1.0 - y)
-                    client.send_message(
-                        f"/pose/torso/z/", z)
-
-        client.send_message("/pose/tracked/",
-                            len(detection_result.pose_landmarks))
-
-        annotated_image = draw.draw_pose_landmarks_on_image(
-            image.numpy_view(), detection_result)
-        cv2.imshow("Pose Tracking", cv2.cvtColor(
-            cv2.flip(annotated_image, 1), cv2.COLOR_RGB2BGR))
-
-    capture.release()
+import features as feat
+import identity as idt
+import landmarks as lmk
+import messages as msg
+import osc_output as osc
+import pipeline as pipe
+import prediction as pred
+import recording as rec
+import stats as st
+
+
+def pose_detector(running=det.IMAGE, count=1):
+    vision = det.vision()
+    return det.Detector(vision.PoseLandmarker, vision.PoseLandmarkerOptions,
+                        'pose_landmarker.task', running,
+                        output_segmentation_masks=False,
+                        num_poses=count)
+
+
+def pose_track(width=640, height=480, address="127.0.0.1", port=8000, device=0, mode=0, out=lmk.INSIDE, compact=osc.SPLIT, bundle=False, deadband=0.0, keyframe=1.0, running=det.IMAGE, headless=False, preview_fps=0.0, record=None, stats=0.0, stats_port=None, scale=1.0, roi=0.0, target_fps=0.0, every=1, predict=0.0, targets=None, count=1, features=(), backend="any", fourcc=None, capture_fps=0.0, buffer_size=0, startup_report=False, capture=None):
+    report = st.StartupReport() if startup_report else None
+
+    # device is one index, or a list of them to track several cameras
+    devices = device if isinstance(device, (list, tuple)) else [device]
+    captures = [capture] if capture is not None else pipe.open_captures(devices, width, height, backend, fourcc, capture_fps, buffer_size)
+    cameras = len(captures)
+    if report is not None:
+        report.mark("cameras")
+    detectors = det.camera_detectors(lambda: pose_detector(running, count), cameras, running)
+    if report is not None:
+        report.mark("models")
+    det.warm_up(detectors, width, height)
+    if report is not None:
+        report.mark("warm-up")
+
+    layout = lmk.pose_layout(mode)
+
+    def camera(n, capture, detector):
+        # Everything but the detectors is separate for each camera
+        prefix = pipe.camera_prefix(n, cameras)
+        output = osc.OscOutput(address, port, compact, bundle, deadband, keyframe, targets, prefix)
+
+        recorder = rec.Recorder(rec.camera_path(record, n, cameras), rec.stride(["pose"])) if record else None
+
+        identities = idt.Identities(count) if count > 1 else None
+
+        derived = feat.Features("/pose", features, layout) if features else None
+
+        def messages(index, sets, measured):
+            if measured is not None:
+                output.send_value("/pose/measured/", measured)
+            msg.send_pose(output, layout, sets[rec.POSE], out, count)
+            if derived is not None:
+                derived.send(output, sets[feat.FEATURES], count)
+
+        sender = pipe.CameraOutput(output, messages, recorder, predict, report)
+
+        def send(frame):
+            poses = msg.pose_arrays(frame.result)
+            if identities is not None:
+                poses = msg.identify(poses, identities)
+            sets = {rec.POSE: poses}
+            if derived is not None:
+                aspect = frame.rgb.shape[1] / frame.rgb.shape[0]
+                sets[feat.FEATURES] = derived.compute(poses, frame.timestamp, aspect)
+            sender.send(frame, sets)
+
+        tracker_stats = st.Stats(prefix + "/pose", output, stats, stats_port) if stats > 0 else None
+
+        pipeline = pipe.Pipeline(capture, adapt.wrap(detector, scale, roi, target_fps, every, running), send,
+                                 None if headless else draw.draw_pose_landmarks_on_image,
+                                 pipe.camera_title("Pose Tracking", n, cameras), preview_fps,
+                                 stats=tracker_stats)
+        return pipeline, sender
+
+    try:
+        pipe.run_cameras(captures, detectors, camera)
+    finally:
+        det.close_all(detectors)
 
 
 if __name__ == '__main__':
@@ -187,16 +103,35 @@ if __name__ == '__main__':
     parser.add_argument(
         '-a', '--address', help="address to send OSC messages (default 127.0.0.1)", default="127.0.0.1")
     parser.add_argument(
-        '-d', '--device', help="index of the video device to use (default 0)", type=int, default=0)
+        '-d', '--device', help="index of the video device to use (default 0); with several, each camera is tracked and sent under /cam/<n>/", type=int, nargs='+', default=0)
     parser.add_argument(
         '-m', '--mode', help="send a simplified and named list of the landmarks (0, default) or send all the numbered landmarks (1)", type=int, default=0)
+    parser.add_argument(
+        '-n', '--count', help="maximum number of people to track (default 1); with more, each person is sent under /pose/<id>/", type=int, default=1)
     parser.add_argument(
         '-p', '--port', help="port to send OSC messages (default 8000)", type=int, default=8000)
     parser.add_argument(
         '-s', '--size', help="width and height of the capture window", nargs=2, type=int, default=[640, 480], metavar=('WIDTH', 'HEIGHT'))
     parser.add_argument(
         '-o', '--out', help="do not send/update coordinates of the off-screen points (0), clamp their x/y inside [0.0, 1.0] (1) or pass them as they are (2, default)", type=int, default=2)
+    parser.add_argument(
+        '--record', help="also write the landmarks to a recording file, to be sent again with replay.py", metavar='FILE', default=None)
+    osc.add_arguments(parser)
+    st.add_arguments(parser)
+    det.add_arguments(parser)
+    adapt.add_arguments(parser)
+    pred.add_arguments(parser)
+    feat.add_arguments(parser)
+    pipe.add_arguments(parser)
     args = parser.parse_args()
+    adapt.check_arguments(parser, args)
 
     pose_track(args.size[0], args.size[1],
-               args.address, args.port, args.device, args.mode, args.out)
+               args.address, args.port, args.device, args.mode, args.out,
+               args.compact, args.bundle, args.deadband, args.keyframe,
+               args.running, args.headless, args.preview_fps, args.record,
+               args.stats, args.stats_port,
+               args.scale, args.roi, args.target_fps, args.every,
+               args.predict, args.target, args.count, args.features,
+               args.backend, args.fourcc, args.capture_fps, args.buffer_size,
+               args.startup_report)
@@ -0,0 +1,134 @@
+#   Copyright 2024 Valerio Orlandini
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+# Fixed-rate output of the landmarks, predicted between detections. Each
+# landmark follows a constant velocity model, estimated for whole landmark
+# sets at once with an alpha-beta filter (the steady state of a Kalman
+# filter for that model). A timer thread emits a frame on every tick: the
+# last measurement once, as detected, when a new one is available, then
+# predictions from the filtered position and velocity.
+#
+# The output runs behind the capture by the smoothed detection latency, so
+# that predictions fill the time between measurements instead of running
+# ahead of them and jumping back when the next one arrives.
+
+import threading
+import time
+import numpy as np
+
+
+ALPHA = 0.8
+BETA = 0.5
+# Predictions stop moving this many seconds after the last measurement
+HORIZON = 0.25
+# Smoothing of the measured latency
+SMOOTHING = 0.1
+
+
+class Predictor:
+    # emit(index, timestamp, sets, measured) sends a frame, sets being a
+    # dictionary of (slot, points) lists by tracker (as the recording module
+    # uses) and measured 1 for a measurement, 0 for a prediction. It is only
+    # called from the timer thread.
+    def __init__(self, emit, rate=120.0, alpha=ALPHA, beta=BETA, horizon=HORIZON):
+        self.emit = emit
+        self.rate = rate
+        self.alpha = alpha
+        self.beta = beta
+        self.horizon = horizon
+        self._states = {}
+        self._trackers = ()
+        self._index = 0
+        self._timestamp = 0.0
+        self._latency = None
+        self._fresh = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="prediction", daemon=True)
+
+    def measure(self, index, timestamp, sets):
+        latency = time.time() - timestamp
+        with self._lock:
+            if self._latency is None:
+                self._latency = latency
+            self._latency += SMOOTHING * (latency - self._latency)
+
+            states = {}
+            for tracker, tracker_sets in sets.items():
+                for slot, points in tracker_sets:
+                    key = (tracker, slot)
+                    if key in states:
+                        continue
+                    state = self._states.get(key)
+                    dt = 0.0 if state is None else timestamp - state[2]
+                    if state is None or state[0].shape != points.shape or dt <= 1e-3:
+                        states[key] = (points, np.zeros_like(points), timestamp, points)
+                        continue
+                    # New arrays are made, as the timer thread may still be
+                    # reading the previous ones
+                    position, velocity, _, _ = state
+                    predicted = position + velocity * dt
+                    residual = points - predicted
+                    states[key] = (predicted + self.alpha * residual,
+                                   velocity + (self.beta / dt) * residual,
+                                   timestamp, points)
+            # Sets that are no longer detected are forgotten
+            self._states = states
+            self._trackers = tuple(sets)
+            self._index = index
+            self._timestamp = timestamp
+            self._fresh = True
+
+    def _tick(self):
+        with self._lock:
+            if not self._trackers:
+                return
+            measured = self._fresh
+            self._fresh = False
+            timestamp = self._timestamp if measured else time.time() - self._latency
+            sets = {tracker: [] for tracker in self._trackers}
+            for (tracker, slot), (position, velocity, last, raw) in self._states.items():
+                if measured:
+                    points = raw
+                else:
+                    dt = min(max(timestamp - last, 0.0), self.horizon)
+                    points = position + velocity * dt
+                sets[tracker].append((slot, points))
+            index = self._index
+        self.emit(index, timestamp, sets, int(measured))
+
+    def _run(self):
+        period = 1.0 / self.rate
+        next_tick = time.perf_counter()
+        while not self._stop.is_set():
+            self._tick()
+            next_tick += period
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                self._stop.wait(delay)
+            else:
+                # Late ticks are skipped rather than sent in a burst
+                next_tick = time.perf_counter()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        '--predict', help="send the landmarks this many times per second, predicting them between detections, with a /measured/ flag (default 0, send each detection)", type=float, default=0.0, metavar='RATE')
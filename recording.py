@@ -0,0 +1,160 @@
+#   Copyright 2024 Valerio Orlandini
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+# Binary landmark recordings. A recording is a 16 bytes header (magic,
+# stride and number of records, uint32) followed by fixed-size records, one
+# per detected landmark set:
+#
+#   timestamp  float64   capture time, in seconds
+#   tracker    uint16    FACE, HANDS or POSE
+#   slot       uint16    hand side (0 left, 1 right) or detection index
+#   count      uint32    number of landmarks, 0 if nothing was detected
+#   landmarks  float32   (stride, 3) raw x, y and z, first count rows used
+#
+# Every tracker writes at least one record per frame, so that frames where
+# nothing was detected are kept. Records are appended through a memory map
+# that grows in blocks, and the number of records in the header is written
+# after each write, so that a recording whose process died before closing
+# it is read up to its last record instead of to the end of the block.
+
+import os
+import numpy as np
+import landmarks as lmk
+
+
+MAGIC = b"VISIOSC\x01"
+HEADER = 16
+BLOCK = 4096
+
+FACE = 0
+HANDS = 1
+POSE = 2
+
+TRACKERS = ("face", "hands", "pose")
+COUNTS = (lmk.FACE_COUNT, lmk.HAND_COUNT, lmk.POSE_COUNT)
+
+
+def stride(trackers):
+    # Smallest stride holding the landmarks of all the given trackers
+    return max(COUNTS[TRACKERS.index(name)] for name in trackers)
+
+
+def record_dtype(stride):
+    return np.dtype([("timestamp", "<f8"), ("tracker", "<u2"), ("slot", "<u2"),
+                     ("count", "<u4"), ("landmarks", "<f4", (stride, 3))])
+
+
+def camera_path(path, camera, cameras):
+    # With several cameras, each one is recorded to its own file:
+    # take.vrec becomes take-cam0.vrec, take-cam1.vrec...
+    if cameras == 1:
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}-cam{camera}{extension}"
+
+
+class Recorder:
+    # The file stays open, unbuffered, to update the number of records of
+    # the header; the records are mapped separately, and unmapped before the
+    # file is extended, as Windows cannot resize a mapped file
+    def __init__(self, path, stride=lmk.FACE_COUNT):
+        self.path = path
+        self.stride = stride
+        self.dtype = record_dtype(stride)
+        self.count = 0
+        self._capacity = 0
+        self._records = None
+        self._file = open(path, "w+b", buffering=0)
+        self._file.write(MAGIC + np.array([stride, 0], dtype="<u4").tobytes())
+        self._grow()
+
+    def _unmap(self):
+        if self._records is not None:
+            self._records.flush()
+            self._records = None
+
+    def _write_count(self):
+        self._file.seek(HEADER - 4)
+        self._file.write(np.array(self.count, dtype="<u4").tobytes())
+
+    def _grow(self):
+        self._unmap()
+        self._capacity += BLOCK
+        self._file.truncate(HEADER + self._capacity * self.dtype.itemsize)
+        self._records = np.memmap(self.path, dtype=self.dtype, mode="r+",
+                                  offset=HEADER, shape=(self._capacity,))
+
+    def write(self, timestamp, tracker, sets):
+        # sets is a list of (slot, points) pairs, as built by the messages
+        # module; an empty list writes a record with no landmarks
+        for slot, points in sets or ((0, None),):
+            if self.count == self._capacity:
+                self._grow()
+            i = self.count
+            count = 0 if points is None else min(len(points), self.stride)
+            self._records["timestamp"][i] = timestamp
+            self._records["tracker"][i] = tracker
+            self._records["slot"][i] = slot
+            self._records["count"][i] = count
+            if count:
+                self._records["landmarks"][i, :count] = points[:count]
+            self.count += 1
+        self._write_count()
+
+    def close(self):
+        if self._file is None:
+            return
+        self._unmap()
+        self._write_count()
+        self._file.truncate(HEADER + self.count * self.dtype.itemsize)
+        self._file.close()
+        self._file = None
+
+
+class Recording:
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            header = file.read(HEADER)
+        if header[:8] != MAGIC:
+            raise ValueError(f"{path} is not a landmark recording")
+        self.stride, count = np.frombuffer(header, dtype="<u4", count=2, offset=len(MAGIC)).tolist()
+        self.dtype = record_dtype(self.stride)
+        # Records past the count of the header were never written
+        count = min(count, (os.path.getsize(path) - HEADER) // self.dtype.itemsize)
+        self.records = np.memmap(path, dtype=self.dtype, mode="r",
+                                 offset=HEADER, shape=(count,))
+
+    def __len__(self):
+        return len(self.records)
+
+    def frames(self):
+        # Yields (timestamp, {tracker: [(slot, points), ...]}) for each frame
+        if not len(self.records):
+            return
+        timestamps = self.records["timestamp"]
+        bounds = np.flatnonzero(np.diff(timestamps)) + 1
+        starts = np.concatenate(([0], bounds))
+        ends = np.concatenate((bounds, [len(timestamps)]))
+        trackers = self.records["tracker"]
+        slots = self.records["slot"]
+        counts = self.records["count"]
+        landmarks = self.records["landmarks"]
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            sets = {}
+            for i in range(start, end):
+                tracker_sets = sets.setdefault(int(trackers[i]), [])
+                count = int(counts[i])
+                if count:
+                    tracker_sets.append((int(slots[i]), np.array(landmarks[i, :count])))
+            yield float(timestamps[start]), sets
@@ -0,0 +1,90 @@
+#   Copyright 2024 Valerio Orlandini
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+# Sends a landmark recording again over OSC, with the same messages as the
+# trackers. Neither MediaPipe nor a camera is needed.
+
+import argparse
+import time
+import landmarks as lmk
+import messages as msg
+import osc_output as osc
+import recording as rec
+
+
+def replay(path, address="127.0.0.1", port=8000, mode=0, out=lmk.INSIDE, compact=osc.SPLIT, bundle=False, deadband=0.0, keyframe=1.0, speed=1.0, loop=False, targets=None, count=1):
+    recording = rec.Recording(path)
+    output = osc.OscOutput(address, port, compact, bundle, deadband, keyframe, targets)
+
+    face_layout = lmk.face_layout(mode)
+    hand_layout = lmk.hand_layout(mode)
+    pose_layout = lmk.pose_layout(mode)
+
+    sent = 0
+    start_time = time.perf_counter()
+    try:
+        while True:
+            first = None
+            clock = time.perf_counter()
+            for timestamp, sets in recording.frames():
+                if first is None:
+                    first = timestamp
+                if speed > 0:
+                    # Frames are sent at their original pace, divided by speed
+                    delay = clock + (timestamp - first) / speed - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                output.begin_frame(timestamp)
+                if rec.FACE in sets:
+                    msg.send_face(output, face_layout, sets[rec.FACE], count)
+                if rec.HANDS in sets:
+                    msg.send_hands(output, hand_layout, sets[rec.HANDS], 2 * count)
+                if rec.POSE in sets:
+                    msg.send_pose(output, pose_layout, sets[rec.POSE], out, count)
+                output.end_frame()
+                sent += 1
+            if not loop or first is None:
+                break
+    except KeyboardInterrupt:
+        pass
+
+    elapsed = time.perf_counter() - start_time
+    print(f"Sent {sent} frames in {elapsed:.1f} s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Send a landmark recording to OSC")
+    parser.add_argument(
+        'recording', help="recording file written with the --record option of the trackers")
+    parser.add_argument(
+        '-a', '--address', help="address to send OSC messages (default 127.0.0.1)", default="127.0.0.1")
+    parser.add_argument(
+        '-l', '--loop', help="start again from the beginning at the end of the recording", action='store_true')
+    parser.add_argument(
+        '-m', '--mode', help="send a simplified and named list of the landmarks (0, default) or send all the numbered landmarks (1)", type=int, default=0)
+    parser.add_argument(
+        '-n', '--count', help="maximum number of people of the recording (default 1), to send each one under /face/<id>/, /hands/<id>/ and /pose/<id>/ when more than 1", type=int, default=1)
+    parser.add_argument(
+        '-o', '--out', help="pose tracking: do not send/update coordinates of the off-screen points (0), clamp their x/y inside [0.0, 1.0] (1) or pass them as they are (2, default)", type=int, default=2)
+    parser.add_argument(
+        '-p', '--port', help="port to send OSC messages (default 8000)", type=int, default=8000)
+    parser.add_argument(
+        '-x', '--speed', help="playback speed, as a multiple of the recorded one (default 1.0, 0 to send the frames as fast as possible)", type=float, default=1.0)
+    osc.add_arguments(parser)
+    args = parser.parse_args()
+
+    replay(args.recording, args.address, args.port, args.mode, args.out,
+           args.compact, args.bundle, args.deadband, args.keyframe,
+           args.speed, args.loop, args.target, args.count)
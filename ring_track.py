@@ -0,0 +1,154 @@
+#   Copyright 2024 Valerio Orlandini
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import argparse
+import multiprocessing
+import time
+import detection as det
+import face_track
+import frame_ring as ring
+import hands_track
+import landmarks as lmk
+import osc_output as osc
+import pipeline as pipe
+import pose_track
+
+
+TRACKERS = {
+    "face": face_track.face_track,
+    "hands": hands_track.hand_track,
+    "pose": pose_track.pose_track
+}
+
+# Seconds between two checks that the workers are still running
+WORKER_CHECK = 0.5
+
+
+def ring_track(trackers=tuple(TRACKERS), workers=1, width=640, height=480, address="127.0.0.1", port=8000, device=0, mode=0, out=lmk.INSIDE, compact=osc.SPLIT, bundle=False, deadband=0.0, keyframe=1.0, running=det.IMAGE, targets=None, count=1, backend="any", fourcc=None, capture_fps=0.0, buffer_size=0):
+    capture = pipe.open_captures([device], width, height, backend, fourcc, capture_fps, buffer_size)[0]
+
+    fail_counter = 0
+    success, img = capture.read()
+    while not success:
+        fail_counter += 1
+        if fail_counter >= pipe.MAX_FAILURES:
+            print("Unable to capture from camera: too many failed attempts")
+            capture.release()
+            return
+        success, img = capture.read()
+
+    # Sizing heuristic: a couple of frames for each worker, so that a slot is
+    # unlikely to be overwritten while it is still being processed; the ring
+    # does not enforce it
+    slots = 4 + 2 * workers * len(trackers)
+    frames = ring.FrameRing(img.shape, slots)
+
+    context = multiprocessing.get_context("spawn")
+    processes = []
+    names = []
+    # Process.start() drops its arguments: the claim counters are kept here,
+    # as their semaphores are removed once no longer referenced
+    claims = []
+    for name in trackers:
+        # Workers of the same tracker share a claim counter and split the
+        # frames among themselves
+        claim = context.Value('q', -1)
+        claims.append(claim)
+        for _ in range(workers):
+            kwargs = {"address": address, "port": port, "mode": mode,
+                      "compact": compact, "bundle": bundle, "deadband": deadband,
+                      "keyframe": keyframe, "running": running, "targets": targets,
+                      "headless": True,
+                      "capture": ring.RingCapture(frames.name, img.shape, slots, claim)}
+            # count is the number of people, as for multi_track
+            kwargs["count"] = 2 * count if name == "hands" else count
+            if name == "pose":
+                kwargs["out"] = out
+            processes.append(context.Process(target=TRACKERS[name], kwargs=kwargs))
+            names.append(name)
+
+    for process in processes:
+        process.start()
+
+    fail_counter = 0
+    next_check = time.monotonic() + WORKER_CHECK
+    try:
+        while True:
+            frames.write(img)
+            if time.monotonic() >= next_check:
+                next_check = time.monotonic() + WORKER_CHECK
+                # A worker only stops by itself on an error: the others are
+                # stopped too, rather than tracking without it
+                stopped = [(name, process) for name, process in zip(names, processes)
+                           if not process.is_alive()]
+                for name, process in stopped:
+                    print(f"The {name} tracker worker stopped (exit code {process.exitcode})")
+                if stopped:
+                    break
+            success, img = capture.read()
+            while not success:
+                fail_counter += 1
+                if fail_counter >= pipe.MAX_FAILURES:
+                    print("Unable to capture from camera: too many failed attempts")
+                    raise KeyboardInterrupt
+                success, img = capture.read()
+            fail_counter = 0
+    except KeyboardInterrupt:
+        pass
+    finally:
+        frames.finish()
+        for process in processes:
+            process.join()
+        capture.release()
+        frames.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Landmark trackers to OSC running in worker processes that share the captured frames")
+    parser.add_argument(
+        '-t', '--trackers', help="trackers to run on each frame (default face hands pose)", nargs='+', choices=tuple(TRACKERS), default=list(TRACKERS))
+    parser.add_argument(
+        '-w', '--workers', help="number of worker processes for each tracker (default 1); with more than 1, -e and -n greater than 1 are not available, as each worker would keep its own deadband and IDs", type=int, default=1)
+    parser.add_argument(
+        '-a', '--address', help="address to send OSC messages (default 127.0.0.1)", default="127.0.0.1")
+    parser.add_argument(
+        '-d', '--device', help="index of the video device to use (default 0)", type=int, default=0)
+    parser.add_argument(
+        '-m', '--mode', help="send a simplified and named list of the landmarks (0, default) or send all the numbered landmarks (1)", type=int, default=0)
+    parser.add_argument(
+        '-n', '--count', help="maximum number of people to track (default 1): as many faces and poses, twice as many hands; with more than 1, each one is sent under /face/<id>/, /hands/<id>/ and /pose/<id>/", type=int, default=1)
+    parser.add_argument(
+        '-p', '--port', help="port to send OSC messages (default 8000)", type=int, default=8000)
+    parser.add_argument(
+        '-s', '--size', help="width and height of the capture window", nargs=2, type=int, default=[640, 480], metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument(
+        '-o', '--out', help="pose tracking: do not send/update coordinates of the off-screen points (0), clamp their x/y inside [0.0, 1.0] (1) or pass them as they are (2, default)", type=int, default=2)
+    osc.add_arguments(parser)
+    det.add_arguments(parser)
+    pipe.add_capture_arguments(parser)
+    args = parser.parse_args()
+    if args.workers > 1:
+        # Each worker sends its own frames, with its own deadband and IDs
+        if args.deadband and any(value for _, value in args.deadband):
+            parser.error("-e can only be used with -w 1")
+        if args.count > 1:
+            parser.error("-n greater than 1 can only be used with -w 1")
+
+    ring_track(dict.fromkeys(args.trackers), args.workers,
+               args.size[0], args.size[1],
+               args.address, args.port, args.device, args.mode, args.out,
+               args.compact, args.bundle, args.deadband, args.keyframe,
+               args.running, args.target, args.count,
+               args.backend, args.fourcc, args.capture_fps, args.buffer_size)
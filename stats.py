@@ -0,0 +1,152 @@
+#   Copyright 2024 Valerio Orlandini
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+# Runtime statistics of a tracker, sent every interval seconds under
+# <prefix>/stats/:
+#
+#   fps/              frames sent per second
+#   capture/fps/      frames captured per second
+#   inference/        p50, p95 and max inference time, in ms
+#   latency/          p50, p95 and max time from capture to OSC, in ms
+#   dropped/          frames captured but not sent during the interval
+#   failures/         consecutive and total failed captures
+#   messages/         OSC messages sent per second
+#   bytes/            bytes sent per second
+#
+# Times are kept for the last WINDOW frames in fixed arrays.
+#
+# StartupReport prints how long a tracker took to send its first message,
+# split into the imports, the opening of the cameras, the loading and the
+# warm-up of the models, and the first frame.
+
+import os
+import threading
+import time
+import numpy as np
+import osc_output as osc
+
+
+WINDOW = 256
+
+IMPORTED = time.time()
+
+
+class Stats:
+    # output is the OscOutput of the tracker, whose counters are read.
+    # Statistics are sent to the targets of the tracker, or over UDP to the
+    # given port of its first target, through their own socket: the tracker
+    # output may be in use by another thread, such as the prediction timer.
+    def __init__(self, prefix, output, interval=1.0, port=None):
+        self.prefix = f"{prefix}/stats"
+        self.tracker_output = output
+        self.output = osc.OscOutput(targets=output.targets if not port else
+                                    [(osc.UDP, output.targets[0][1], port)])
+        self.interval = interval
+        self._inference = np.zeros(WINDOW)
+        self._latency = np.zeros(WINDOW)
+        self._count = 0
+        self._last = None
+
+    def update(self, pipeline, frame):
+        i = self._count % WINDOW
+        self._latency[i] = time.time() - frame.timestamp
+        if frame.stages is not None:
+            self._inference[i] = frame.stages.get("inference", 0.0)
+        self._count += 1
+
+        now = time.monotonic()
+        if self._last is None:
+            self._last = (now, self._count, pipeline.captured,
+                          self.tracker_output.sent_messages,
+                          self.tracker_output.sent_bytes)
+        elif now - self._last[0] >= self.interval:
+            self.publish(pipeline, now)
+
+    def _times(self, address, values):
+        values = values[:min(self._count, WINDOW)] * 1000.0
+        p50, p95 = np.percentile(values, (50, 95))
+        self.output.send(f"{self.prefix}/{address}/",
+                         float(p50), float(p95), float(values.max()))
+
+    def publish(self, pipeline, now):
+        last_time, last_count, last_captured, last_messages, last_bytes = self._last
+        output = self.tracker_output
+        elapsed = now - last_time
+        frames = self._count - last_count
+        captured = pipeline.captured - last_captured
+        self._last = (now, self._count, pipeline.captured,
+                      output.sent_messages, output.sent_bytes)
+
+        send = self.output.send
+        send(f"{self.prefix}/fps/", frames / elapsed)
+        send(f"{self.prefix}/capture/fps/", captured / elapsed)
+        self._times("inference", self._inference)
+        self._times("latency", self._latency)
+        send(f"{self.prefix}/dropped/", max(captured - frames, 0))
+        send(f"{self.prefix}/failures/", pipeline.fail_counter, pipeline.failures)
+        send(f"{self.prefix}/messages/", (output.sent_messages - last_messages) / elapsed)
+        send(f"{self.prefix}/bytes/", (output.sent_bytes - last_bytes) / elapsed)
+
+
+def process_start():
+    # Wall clock time at which the process started, from /proc on Linux, or
+    # else the time at which this module was imported
+    try:
+        with open("/proc/self/stat") as stat:
+            # Fields after the command name, which may contain spaces;
+            # starttime is the 22nd field of the line, in clock ticks
+            ticks = int(stat.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as uptime:
+            boot = time.time() - float(uptime.read().split()[0])
+        return boot + ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return IMPORTED
+
+
+class StartupReport:
+    # mark(phase) ends a phase of the startup; sent() is called after each
+    # sent frame, from any thread, and prints the report after the first one
+    def __init__(self):
+        self.start = process_start()
+        self._last = self.start
+        self._phases = []
+        # Created at the start of a tracker, once everything is imported
+        self.mark("imports")
+        self._lock = threading.Lock()
+        self._done = False
+
+    def mark(self, phase):
+        now = time.time()
+        self._phases.append((phase, now - self._last))
+        self._last = now
+
+    def sent(self):
+        if self._done:
+            return
+        with self._lock:
+            if self._done:
+                return
+            self._done = True
+        self.mark("first frame")
+        phases = ", ".join(f"{phase} {seconds:.3f} s" for phase, seconds in self._phases)
+        print(f"First OSC message {self._last - self.start:.3f} s after start ({phases})")
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        '--stats', help="send runtime statistics every this many seconds (default 0, never)", type=float, default=0.0, metavar='SECONDS')
+    parser.add_argument(
+        '--stats-port', help="port to send runtime statistics (default: the port of the OSC messages)", type=int, default=None)
+    parser.add_argument(
+        '--startup-report', help="print the time from the start of the process to the first OSC message, phase by phase", action='store_true')
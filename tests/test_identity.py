@@ -0,0 +1,75 @@
+#   Copyright 2024 Valerio Orlandini
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import numpy as np
+import identity as idt
+
+
+def test_new_tracks_get_smallest_ids():
+    identities = idt.Identities(3)
+    ids = identities.assign([[0.1, 0.1], [0.9, 0.9]], now=0.0)
+    assert ids.tolist() == [0, 1]
+
+
+def test_tracks_keep_their_ids():
+    identities = idt.Identities(3)
+    identities.assign([[0.1, 0.1], [0.9, 0.9]], now=0.0)
+    # Same detections, moved a little and in the opposite order
+    ids = identities.assign([[0.88, 0.9], [0.12, 0.1]], now=0.1)
+    assert ids.tolist() == [1, 0]
+
+
+def test_ids_beyond_count():
+    identities = idt.Identities(2)
+    ids = identities.assign([[0.1, 0.1], [0.5, 0.5], [0.9, 0.9]], now=0.0)
+    assert sorted(ids.tolist()) == [-1, 0, 1]
+
+
+def test_far_detection_gets_new_id():
+    identities = idt.Identities(2)
+    identities.assign([[0.1, 0.1]], now=0.0)
+    ids = identities.assign([[0.9, 0.9]], now=0.1)
+    assert ids.tolist() == [1]
+
+
+def test_lost_track_gets_id_back_before_timeout():
+    identities = idt.Identities(2, timeout=0.5)
+    identities.assign([[0.1, 0.1], [0.9, 0.9]], now=0.0)
+    identities.assign([[0.9, 0.9]], now=0.2)
+    ids = identities.assign([[0.1, 0.12], [0.9, 0.9]], now=0.4)
+    assert ids.tolist() == [0, 1]
+
+
+def test_expired_id_is_reused():
+    identities = idt.Identities(2, timeout=0.5)
+    identities.assign([[0.1, 0.1], [0.9, 0.9]], now=0.0)
+    identities.assign([[0.9, 0.9]], now=0.4)
+    ids = identities.assign([[0.5, 0.5], [0.9, 0.9]], now=0.8)
+    assert ids.tolist() == [0, 1]
+
+
+def test_groups():
+    # Two groups (hand sides): the IDs of group g are g, g + 2, g + 4...
+    identities = idt.Identities(2, groups=2)
+    ids = identities.assign([[0.1, 0.1], [0.2, 0.2], [0.8, 0.8]], groups=[1, 0, 1], now=0.0)
+    assert ids.tolist() == [1, 0, 3]
+    # A detection is never matched to a track of the other group
+    ids = identities.assign([[0.2, 0.2]], groups=[1], now=0.1)
+    assert ids.tolist() == [1]
+
+
+def test_empty():
+    identities = idt.Identities(2)
+    ids = identities.assign(np.empty((0, 2)), now=0.0)
+    assert ids.shape == (0,)
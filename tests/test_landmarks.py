@@ -0,0 +1,108 @@
+#   Copyright 2024 Valerio Orlandini
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import types
+import numpy as np
+import landmarks as lmk
+
+
+def random_points(count, low=-0.5, high=1.5, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(low, high, (count, 3)).astype(np.float32)
+
+
+def test_to_array():
+    landmarks = [types.SimpleNamespace(x=0.1 * i, y=0.2 * i, z=-0.3 * i) for i in range(4)]
+    points = lmk.to_array(landmarks)
+    assert points.shape == (4, 3)
+    assert points.dtype == np.float32
+    np.testing.assert_allclose(points[3], (0.3, 0.6, -0.9), rtol=1e-6)
+
+
+def test_clamp():
+    points = random_points(50)
+    z = points[:, 2].copy()
+    result = lmk.clamp(points)
+    assert result is points
+    assert (points[:, :2] >= 0.0).all() and (points[:, :2] <= 1.0).all()
+    # z is never clamped
+    np.testing.assert_array_equal(points[:, 2], z)
+
+
+def test_onscreen():
+    points = np.array([[0.0, 0.0, 5.0], [1.0, 1.0, -5.0], [0.5, 1.01, 0.0],
+                       [-0.01, 0.5, 0.0], [0.3, 0.7, 0.0]], dtype=np.float32)
+    np.testing.assert_array_equal(lmk.onscreen(points), [True, True, False, False, True])
+
+
+def test_mirror():
+    points = random_points(20)
+    expected = points.copy()
+    expected[:, 0] = 1.0 - expected[:, 0]
+    expected[:, 1] = 1.0 - expected[:, 1]
+    lmk.mirror(points)
+    np.testing.assert_allclose(points, expected, rtol=1e-6)
+
+
+def test_postprocess_inside():
+    points = random_points(33)
+    raw = points.copy()
+    visible = lmk.postprocess(points, lmk.INSIDE)
+    # Off-screen points are reported, not clamped, and every point is mirrored
+    expected = [0.0 <= x <= 1.0 and 0.0 <= y <= 1.0 for x, y, _ in raw.tolist()]
+    np.testing.assert_array_equal(visible, expected)
+    np.testing.assert_allclose(points[:, :2], 1.0 - raw[:, :2], rtol=1e-6)
+    np.testing.assert_array_equal(points[:, 2], raw[:, 2])
+
+
+def test_postprocess_clamp_and_pass():
+    points = random_points(33)
+    raw = points.copy()
+    assert lmk.postprocess(points, lmk.CLAMP) is None
+    np.testing.assert_allclose(points[:, :2], 1.0 - np.clip(raw[:, :2], 0.0, 1.0), rtol=1e-6)
+
+    points = raw.copy()
+    assert lmk.postprocess(points, lmk.PASS) is None
+    np.testing.assert_allclose(points[:, :2], 1.0 - raw[:, :2], rtol=1e-6)
+
+
+def test_select_numbered():
+    points = random_points(lmk.HAND_COUNT)
+    layout = lmk.hand_layout(1)
+    assert layout.names == [str(i) for i in range(lmk.HAND_COUNT)]
+    np.testing.assert_array_equal(layout.select(points), points)
+
+
+def test_select_named():
+    # Named landmarks, then centroids computed as the mean of their
+    # landmarks, as the trackers originally did
+    cases = ((lmk.face_layout(), lmk.FACE_COUNT, lmk.FACE_MARKS, lmk.FACE_CENTROIDS),
+             (lmk.hand_layout(), lmk.HAND_COUNT, lmk.HAND_MARKS, lmk.HAND_CENTROIDS),
+             (lmk.pose_layout(), lmk.POSE_COUNT, lmk.POSE_MARKS, lmk.POSE_CENTROIDS))
+    for layout, count, marks, centroids in cases:
+        points = random_points(count, 0.0, 1.0)
+        rows = layout.select(points)
+        assert layout.names == list(marks) + list(centroids)
+        assert rows.shape == (len(marks) + len(centroids), 3)
+        for row, index in enumerate(marks.values()):
+            np.testing.assert_array_equal(rows[row], points[index])
+        for row, group in enumerate(centroids.values(), len(marks)):
+            expected = np.array([points[i] for i in group]).mean(axis=0)
+            np.testing.assert_allclose(rows[row], expected, rtol=1e-5, atol=1e-6)
+
+
+def test_select_without_centroids():
+    layout = lmk.LandmarkLayout(5, {"a": 4, "b": 1})
+    points = random_points(5)
+    np.testing.assert_array_equal(layout.select(points), points[[4, 1]])
@@ -0,0 +1,97 @@
+#   Copyright 2024 Valerio Orlandini
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import struct
+import numpy as np
+from pythonosc.osc_message import OscMessage
+import osc_encoder as enc
+
+
+def parse(view):
+    message = OscMessage(bytes(view))
+    return message.address, message.params
+
+
+def test_osc_string_padding():
+    assert enc.osc_string("") == b"\x00\x00\x00\x00"
+    assert enc.osc_string("abc") == b"abc\x00"
+    assert enc.osc_string("abcd") == b"abcd\x00\x00\x00\x00"
+
+
+def test_message():
+    message = enc.Message("/face/tracked/", "i")
+    size = struct.unpack(">i", bytes(message.element[:4]))[0]
+    assert size == len(message.message)
+    message.write(3)
+    assert parse(message.message) == ("/face/tracked/", [3])
+    message.write(1)
+    assert parse(message.message) == ("/face/tracked/", [1])
+
+
+def test_write_timetag():
+    buffer = bytearray(8)
+    enc.write_timetag(buffer, 0, 1.5)
+    seconds, fraction = struct.unpack(">II", buffer)
+    assert seconds == 1 + enc.NTP_EPOCH
+    assert fraction == 2 ** 31
+
+
+def test_landmark_block_schemas():
+    coords = np.arange(6, dtype=np.float32).reshape(2, 3) / 8
+    block = enc.LandmarkBlock("/hands/left", ["wrist", "thumb"], enc.SPLIT)
+    block.write(coords)
+    assert [parse(view) for view in block.messages] == [
+        ("/hands/left/wrist/x/", [0.0]), ("/hands/left/wrist/y/", [0.125]),
+        ("/hands/left/wrist/z/", [0.25]), ("/hands/left/thumb/x/", [0.375]),
+        ("/hands/left/thumb/y/", [0.5]), ("/hands/left/thumb/z/", [0.625])]
+
+    block = enc.LandmarkBlock("/pose", range(2), enc.POINT)
+    block.write(coords)
+    assert [parse(view) for view in block.messages] == [
+        ("/pose/0/", [0.0, 0.125, 0.25]), ("/pose/1/", [0.375, 0.5, 0.625])]
+
+    block = enc.LandmarkBlock("/face", ["a", "b"], enc.ARRAY)
+    block.write(coords)
+    assert [parse(view) for view in block.messages] == [
+        ("/face/landmarks/", [0.0, 0.125, 0.25, 0.375, 0.5, 0.625])]
+
+
+def test_landmark_block_elements():
+    block = enc.LandmarkBlock("/face", ["nose"], enc.POINT)
+    block.write(np.ones((1, 3), dtype=np.float32))
+    element = bytes(block.elements[0])
+    assert struct.unpack(">i", element[:4])[0] == len(element) - 4
+    assert element[4:] == bytes(block.messages[0])
+
+
+def test_landmark_block_visible():
+    block = enc.LandmarkBlock("/pose", ["a", "b", "c"], enc.POINT)
+    first = np.full((3, 3), 0.25, dtype=np.float32)
+    block.write(first)
+    second = np.full((3, 3), 0.75, dtype=np.float32)
+    visible = np.array([True, False, True])
+    block.write(second, visible)
+    # Hidden landmarks keep their last values and are left out of the
+    # selected messages
+    assert [parse(view)[1] for view in block.messages] == [[0.75] * 3, [0.25] * 3, [0.75] * 3]
+    selected = block.selected(block.messages, visible)
+    assert [parse(view)[0] for view in selected] == ["/pose/a/", "/pose/c/"]
+    assert block.selected(block.messages, None) is block.messages
+
+
+def test_landmark_block_first_write_ignores_visible():
+    # Nothing was sent yet, so hidden landmarks are written too
+    block = enc.LandmarkBlock("/pose", ["a", "b"], enc.POINT)
+    block.write(np.full((2, 3), 0.5, dtype=np.float32), np.array([True, False]))
+    assert [parse(view)[1] for view in block.messages] == [[0.5] * 3, [0.5] * 3]
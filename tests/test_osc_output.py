@@ -0,0 +1,122 @@
+#   Copyright 2024 Valerio Orlandini
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import argparse
+import numpy as np
+import pytest
+import osc_output as osc
+
+
+def test_parse_deadband():
+    assert osc.parse_deadband("0.01") == (None, 0.01)
+    assert osc.parse_deadband("nose=0.002") == ("nose", 0.002)
+    assert osc.parse_deadband("0=0.5") == ("0", 0.5)
+    with pytest.raises(argparse.ArgumentTypeError):
+        osc.parse_deadband("nose=far")
+
+
+def test_per_landmark_deadband():
+    # The nose has a smaller deadband than the other landmarks
+    output = osc.OscOutput("127.0.0.1", 9, osc.POINT, deadband=[(None, 0.1), ("nose", 0.01)], keyframe=0)
+    names = ["nose", "chin"]
+    coords = np.zeros((2, 3), dtype=np.float32)
+    output.begin_frame()
+    output.send_landmarks("/face", names, coords)
+    output.end_frame()
+    assert output.sent_messages == 2
+
+    output.begin_frame()
+    output.send_landmarks("/face", names, coords + 0.05)
+    output.end_frame()
+    assert output.sent_messages == 3
+
+    output.begin_frame()
+    output.send_landmarks("/face", names, coords + 0.2)
+    output.end_frame()
+    assert output.sent_messages == 5
+    output.close()
+
+
+def test_global_deadband():
+    output = osc.OscOutput("127.0.0.1", 9, osc.POINT, deadband=0.1, keyframe=0)
+    assert output.filtered and not output.deadbands
+    coords = np.zeros((2, 3), dtype=np.float32)
+    for offset in (0.0, 0.05, 0.2):
+        output.begin_frame()
+        output.send_landmarks("/face", ["nose", "chin"], coords + offset)
+        output.end_frame()
+    assert output.sent_messages == 4
+    output.close()
+
+
+def test_hidden_landmark_sent_when_visible():
+    # A landmark hidden on the first frame was never sent: it is sent as
+    # soon as it becomes visible, even within the deadband
+    output = osc.OscOutput("127.0.0.1", 9, osc.POINT, deadband=0.1, keyframe=0)
+    names = ["nose", "leftwrist"]
+    coords = np.full((2, 3), 0.5, dtype=np.float32)
+    output.begin_frame()
+    output.send_landmarks("/pose", names, coords, np.array([True, False]))
+    output.end_frame()
+    assert output.sent_messages == 1
+
+    output.begin_frame()
+    output.send_landmarks("/pose", names, coords + 0.01)
+    output.end_frame()
+    assert output.sent_messages == 2
+    output.close()
+
+
+class PartialSocket:
+    # Takes at most size bytes on each send, as a full non-blocking socket
+    def __init__(self, size):
+        self.size = size
+        self.data = bytearray()
+        self.closed = False
+
+    def send(self, data):
+        sent = bytes(data[:self.size])
+        self.data += sent
+        return len(sent)
+
+    def settimeout(self, timeout):
+        pass
+
+    def sendall(self, data):
+        self.data += data
+
+    def close(self):
+        self.closed = True
+
+
+def test_tcp_partial_send():
+    target = osc.TcpTarget("127.0.0.1", 9)
+    sock = target.sock = PartialSocket(5)
+    packet = b"/a\x00\x00,\x00\x00\x00\xc0\xdb"
+    # Two END bytes around the packet, and two escaped bytes
+    assert target.send(packet) == len(packet) + 4
+    assert len(sock.data) == 5
+    # The rest is sent on the next flushes, without a new packet
+    while target.buffer:
+        target.flush()
+    assert bytes(sock.data) == b"\xc0/a\x00\x00,\x00\x00\x00\xdb\xdc\xdb\xdd\xc0"
+
+
+def test_tcp_close_sends_queued_bytes():
+    target = osc.TcpTarget("127.0.0.1", 9)
+    sock = target.sock = PartialSocket(3)
+    target.send(b"/abc")
+    target.close()
+    assert bytes(sock.data) == b"\xc0/abc\xc0"
+    assert sock.closed and target.sock is None
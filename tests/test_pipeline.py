@@ -0,0 +1,134 @@
+#   Copyright 2024 Valerio Orlandini
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import time
+import cv2
+import numpy as np
+import pytest
+import pipeline as pipe
+
+
+FRAMES = 120
+
+
+class FakeCapture:
+    # Returns uniform frames whose value is their index; the pipeline
+    # converts them into the RGB buffers it reuses
+    def __init__(self, count):
+        self.count = count
+        self.index = 0
+        self.ended = False
+
+    def read(self):
+        if self.index >= self.count:
+            self.ended = True
+            return False, None
+        image = np.full((8, 8, 3), self.index % 256, dtype=np.uint8)
+        self.index += 1
+        time.sleep(0.001)
+        return True, image
+
+
+class SkippingDetector:
+    # Skips one frame in three, as adaptive.AdaptiveDetector with --every
+    # or a landmarker dropping frames in LIVE_STREAM mode
+    def __init__(self):
+        self.torn = 0
+
+    def detect(self, frame, deliver):
+        if frame.index % 3 == 0:
+            return
+        time.sleep(0.002)
+        self.torn += int((frame.rgb != frame.index % 256).any())
+        frame.result = frame.index
+        deliver(frame)
+
+
+def test_buffers_reused_only_once_released(monkeypatch):
+    frames = []
+
+    class Frame(pipe.Frame):
+        __slots__ = ()
+
+        def __init__(self, *args):
+            super().__init__(*args)
+            frames.append(self)
+
+    monkeypatch.setattr(pipe, "Frame", Frame)
+    # No preview window is opened
+    monkeypatch.setattr(cv2, "imshow", lambda title, image: None)
+    held = []
+
+    class Pipeline(pipe.Pipeline):
+        def _take_buffers(self):
+            buffers = super()._take_buffers()
+            held.extend(frame.index for frame in frames
+                        if frame.rgb is buffers[1] and frame.holds > 0)
+            return buffers
+
+    previewed = []
+
+    def draw(image, result, mirror):
+        # A slow preview
+        time.sleep(0.01)
+        previewed.append(result)
+
+    detector = SkippingDetector()
+    pipeline = Pipeline(FakeCapture(FRAMES), detector, lambda frame: None, draw)
+    threads = pipeline.start()
+    while not pipeline.stop.is_set():
+        pipeline._preview()
+        time.sleep(0.001)
+    for thread in threads:
+        thread.join()
+
+    assert pipeline.error is None
+    assert previewed
+    # No buffer was taken while a frame still held it, and the frames
+    # detected were never overwritten
+    assert held == []
+    assert detector.torn == 0
+    # Buffers were reused
+    assert len({id(frame.rgb) for frame in frames}) < FRAMES
+
+
+class FailingDetector:
+    def detect(self, frame, deliver):
+        raise RuntimeError("inference failed")
+
+
+class FakeOutput:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_cameras_closed_when_a_stage_raises():
+    captures = [FakeCapture(FRAMES) for _ in range(2)]
+    released = []
+    for capture in captures:
+        capture.release = lambda capture=capture: released.append(capture)
+    outputs = []
+
+    def camera(n, capture, detector):
+        output = pipe.CameraOutput(FakeOutput(), lambda index, sets, measured: None)
+        outputs.append(output)
+        return pipe.Pipeline(capture, detector, lambda frame: None), output
+
+    with pytest.raises(RuntimeError):
+        pipe.run_cameras(captures, [FailingDetector()] * 2, camera)
+    assert [output.output.closed for output in outputs] == [True, True]
+    assert released == captures
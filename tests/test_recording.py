@@ -0,0 +1,91 @@
+#   Copyright 2024 Valerio Orlandini
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import numpy as np
+import pytest
+import recording as rec
+
+
+def points(count, value):
+    return np.full((count, 3), value, dtype=np.float32)
+
+
+def test_stride():
+    assert rec.stride(["hands"]) == 21
+    assert rec.stride(["hands", "pose"]) == 33
+    assert rec.stride(["face", "pose"]) == 478
+
+
+def test_camera_path():
+    assert rec.camera_path("take.vrec", 0, 1) == "take.vrec"
+    assert rec.camera_path("take.vrec", 1, 2) == "take-cam1.vrec"
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "take.vrec")
+    recorder = rec.Recorder(path, rec.stride(["hands", "pose"]))
+    recorder.write(1.0, rec.HANDS, [(0, points(21, 0.1)), (1, points(21, 0.2))])
+    recorder.write(1.0, rec.POSE, [(0, points(33, 0.3))])
+    recorder.write(2.0, rec.HANDS, [])
+    recorder.write(3.0, rec.POSE, [(0, points(33, 0.4))])
+    recorder.close()
+
+    recording = rec.Recording(path)
+    assert recording.stride == 33
+    assert len(recording) == 5
+    frames = list(recording.frames())
+    assert [timestamp for timestamp, _ in frames] == [1.0, 2.0, 3.0]
+
+    sets = frames[0][1]
+    assert [slot for slot, _ in sets[rec.HANDS]] == [0, 1]
+    np.testing.assert_array_equal(sets[rec.HANDS][1][1], points(21, 0.2))
+    assert sets[rec.POSE][0][1].shape == (33, 3)
+    # Frames where nothing was detected are kept, with no sets
+    assert frames[1][1] == {rec.HANDS: []}
+    np.testing.assert_array_equal(frames[2][1][rec.POSE][0][1], points(33, 0.4))
+
+
+def test_grows_past_a_block(tmp_path):
+    path = str(tmp_path / "take.vrec")
+    recorder = rec.Recorder(path, rec.stride(["hands"]))
+    frames = rec.BLOCK + 10
+    for i in range(frames):
+        recorder.write(float(i), rec.HANDS, [(0, points(21, i))])
+    recorder.close()
+    recording = rec.Recording(path)
+    assert len(recording) == frames
+    last_timestamp, last_sets = list(recording.frames())[-1]
+    assert last_timestamp == frames - 1
+    assert last_sets[rec.HANDS][0][1][0, 0] == frames - 1
+
+
+def test_not_a_recording(tmp_path):
+    path = tmp_path / "other.bin"
+    path.write_bytes(b"\x00" * 64)
+    with pytest.raises(ValueError):
+        rec.Recording(str(path))
+
+
+def test_unclosed_recording(tmp_path):
+    # A recorder that is never closed leaves the rest of its block in the
+    # file: only the records counted in the header are read
+    path = str(tmp_path / "take.vrec")
+    recorder = rec.Recorder(path, rec.stride(["pose"]))
+    recorder.write(1.0, rec.POSE, [(0, points(33, 0.5))])
+    recorder.write(2.0, rec.POSE, [])
+    recording = rec.Recording(path)
+    assert len(recording) == 2
+    assert [timestamp for timestamp, _ in recording.frames()] == [1.0, 2.0]
+    del recording
+    recorder.close()